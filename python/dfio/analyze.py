@@ -1,41 +1,85 @@
 import fixfmt.table
+import itertools
+import numpy as np
+import sys
 
 import dfio.db
+import dfio.stats
 
 #-------------------------------------------------------------------------------
 
 def get_num_cols(schema):
     return len(schema)
 
+def _ratio(num, den):
+    """
+    Returns `num / den`, or NaN if `den` is zero, as for an empty result.
+    """
+    return num / den if den != 0 else float("nan")
+
+
+def _get_timing(rec):
+    """
+    Returns a record's timing summary: warm if measured, otherwise cold.
+    """
+    time = rec["time"]
+    return time if "min" in time else time["cold"]
+
+
 def print_summary(recs):
     t = fixfmt.table.RowTable()
     for r in recs:
-        time = r["time"]["min"]
+        time = _get_timing(r)["min"]
         items = r["length"] * r["cols"]
         t.append(
             operation   =r["operation"],
             schema      =r.get("schema", ""),
             data        =r.get("data", ""),
             length      =r["length"],
+            compact     =r.get("compact", ""),
+            cache       =r.get("cache", ""),
             method      =r["method"]["class"],
             compression =r["method"].get("comp", None),
             engine      =r["method"].get("engine", ""),
-            size_ratio  =r.get("file_size", float("nan")) / r["data_size"],
+            threads     =r["method"].get("threads", ""),
+            size_ratio  =_ratio(
+                r.get("file_size", float("nan")), r["data_size"]),
+            files       =r.get("file_count", ""),
+            pushdown    =r.get("pushdown", ""),
+            mem_ratio   =(
+                _ratio(r["memory"]["rss_peak"], r["data_size"]) if "memory" in r
+                else float("nan")
+            ),
+            # Fraction of wall time on CPU; the rest is mostly blocked on I/O.
+            cpu_frac    =(
+                (r["io"]["user"] + r["io"]["sys"]) / r["io"]["wall"]
+                if "io" in r and r["io"]["wall"] > 0 else float("nan")
+            ),
             time        =time,
+            # Index build time, reported separately from the operation.
+            index_time  =r["index"]["time"] if "index" in r else float("nan"),
             bandwidth   =r["data_size"] / time,
             rate        =items / time,
         )
 
     t.fmts.update(
         size_ratio      =fixfmt.Number(1, 3),
+        mem_ratio       =fixfmt.Number(2, 2),
+        cpu_frac        =fixfmt.Number(1, 2),
         time            =fixfmt.Number(6, 1, scale="m"),
+        index_time      =fixfmt.Number(6, 1, scale="m"),
         rate            =fixfmt.Number(4, 1, scale="M"),
         bandwidth       =fixfmt.Number(4, 1, scale="M"),
     )
 
+    if len(t.rows) == 0:
+        print("no matching records")
+        return
+
     def all_same(n):
         x = t.rows[0][n]
-        return all( r[n] == x for r in t.rows )
+        # NaN for missing values compares unequal to itself.
+        return all( r[n] == x or (r[n] != r[n] and x != x) for r in t.rows )
 
     t.set_fmts()
     for n in t.rows[0]:
@@ -48,12 +92,401 @@ def print_summary(recs):
     t.print()
 
 
+#-------------------------------------------------------------------------------
+
+def parse_selection(spec):
+    """
+    Parses a selection of records.
+
+    The selection is comma-separated `NAME=VALUE` items.  NAME may be `run`,
+    `hostname`, `since`, or `until`; any other NAME selects records with that
+    package version.
+
+      >>> parse_selection("since=2024-01-01,pandas=2.2.0")
+      {'since': '2024-01-01', 'versions': {'pandas': '2.2.0'}}
+
+    """
+    selection = {}
+    for item in spec.split(","):
+        name, eq, value = item.partition("=")
+        name = name.strip()
+        if eq != "=" or name == "":
+            raise ValueError(f"invalid selection: {item}")
+        if name in ("run", "hostname", "since", "until"):
+            selection[name] = value.strip()
+        else:
+            selection.setdefault("versions", {})[name] = value.strip()
+    return selection
+
+
+def select(recs, selection):
+    """
+    Returns records that match a selection, as from `parse_selection`.
+    """
+    def match(rec):
+        timestamp = rec.get("timestamp", "")
+        versions = rec.get("versions", {})
+        return (
+            all(
+                rec.get(n) == selection[n]
+                for n in ("run", "hostname") if n in selection
+            )
+            and ("since" not in selection or timestamp >= selection["since"])
+            and ("until" not in selection or timestamp < selection["until"])
+            and all(
+                versions.get(n) == v
+                for n, v in selection.get("versions", {}).items()
+            )
+        )
+
+    return [ r for r in recs if match(r) ]
+
+
+# Record fields, besides operation, method, and length, that distinguish
+# benchmark configurations.  Records are compared only to records of the same
+# configuration.
+CONFIG_FIELDS = (
+    "cache",
+    "compact",
+    "chunk_size",
+    "batches",
+    "readers",
+    "copies",
+    "filter",
+    "columns",
+    "key",
+    "keys",
+    "range_rows",
+)
+
+# Minimum number of measurements on each side for a significant change.
+MIN_SAMPLES = 2
+
+def _get_config(rec):
+    return " ".join( f"{n}={rec[n]}" for n in CONFIG_FIELDS if n in rec )
+
+
+def _get_key(rec):
+    return (
+        rec["operation"], rec["method_name"], rec["length"], _get_config(rec))
+
+
+def _get_throughputs(recs):
+    # Raw samples if recorded; otherwise, the best from each record.
+    return [
+        r["data_size"] / t
+        for r in recs
+        for t in _get_timing(r).get("samples", [_get_timing(r)["min"]])
+    ]
+
+
+def compare(base_recs, cand_recs, *, threshold=0.05, level=0.95):
+    """
+    Compares throughput and memory of candidate to baseline records.
+
+    Records are matched by operation, method, length, and configuration.  A
+    regression is significant if the entire confidence interval of the ratio
+    is worse than `threshold`.  With fewer than `MIN_SAMPLES` measurements on
+    either side, there is no interval, and the change is marked as having
+    insufficient samples rather than as a regression.
+
+    :return:
+      Iterator of dicts, one per matched method.
+    """
+    def group(recs):
+        groups = {}
+        for rec in recs:
+            groups.setdefault(_get_key(rec), []).append(rec)
+        return groups
+
+    base_groups = group(base_recs)
+    cand_groups = group(cand_recs)
+    for key in sorted(base_groups.keys() & cand_groups.keys()):
+        base = base_groups[key]
+        cand = cand_groups[key]
+        operation, method_name, length, config = key
+        result = {
+            "operation"     : operation,
+            "method"        : method_name,
+            "length"        : length,
+            "config"        : config,
+            "base_count"    : len(base),
+            "cand_count"    : len(cand),
+        }
+        regressed = False
+        notes = []
+
+        def get_ratio(name, base_vals, cand_vals):
+            if min(len(base_vals), len(cand_vals)) < MIN_SAMPLES:
+                ratio = np.median(cand_vals) / np.median(base_vals)
+                lo = hi = float("nan")
+                notes.append(f"{name}: insufficient samples")
+            else:
+                ratio, lo, hi = dfio.stats.ratio_ci(
+                    base_vals, cand_vals, level=level, rng=0)
+            result.update({name: ratio, name + "_lo": lo, name + "_hi": hi})
+            return lo, hi
+
+        # Comparisons with NaN bounds are false, so aren't regressions.
+        _, hi = get_ratio(
+            "throughput", _get_throughputs(base), _get_throughputs(cand))
+        regressed |= hi < 1 - threshold
+
+        base_mem = [ r["memory"]["rss_peak"] for r in base if "memory" in r ]
+        cand_mem = [ r["memory"]["rss_peak"] for r in cand if "memory" in r ]
+        if len(base_mem) > 0 and len(cand_mem) > 0 and np.median(base_mem) > 0:
+            lo, _ = get_ratio("memory", base_mem, cand_mem)
+            regressed |= lo > 1 + threshold
+        else:
+            result.update(
+                memory=float("nan"), memory_lo=float("nan"),
+                memory_hi=float("nan"))
+
+        result["regression"] = regressed
+        result["note"] = "; ".join(notes)
+        yield result
+
+
+def print_comparison(results):
+    t = fixfmt.table.RowTable()
+    for r in results:
+        t.append(**r)
+
+    if len(t.rows) == 0:
+        print("no matching records")
+        return
+
+    ratio = fixfmt.Number(1, 3)
+    t.fmts.update(
+        throughput      =ratio,
+        throughput_lo   =ratio,
+        throughput_hi   =ratio,
+        memory          =ratio,
+        memory_lo       =ratio,
+        memory_hi       =ratio,
+    )
+    t.set_fmts()
+    t.print()
+
+
+#-------------------------------------------------------------------------------
+
+# File operations, and the corresponding in-memory operations.
+IN_MEMORY_OPERATIONS = {
+    "write"         : "serialize",
+    "read"          : "deserialize",
+}
+
+def breakdown(recs):
+    """
+    Breaks down times of file operations into encoding, measured by the
+    corresponding in-memory operation, and the rest, attributed to I/O.
+
+    :return:
+      Iterator of dicts, one per file operation, method, and length with
+      records of both operations.
+    """
+    best = {}
+    for rec in recs:
+        # Cold timings include eviction effects; use only warm ones.
+        if "min" not in rec["time"]:
+            continue
+        key = rec["operation"], rec["method_name"], rec["length"]
+        best[key] = min(best.get(key, float("inf")), rec["time"]["min"])
+
+    for (operation, method_name, length), time in sorted(best.items()):
+        if operation not in IN_MEMORY_OPERATIONS:
+            continue
+        key = IN_MEMORY_OPERATIONS[operation], method_name, length
+        if key not in best:
+            continue
+        encode = best[key]
+        yield {
+            "operation"     : operation,
+            "method"        : method_name,
+            "length"        : length,
+            "time"          : time,
+            "encode"        : encode,
+            "io"            : time - encode,
+            "io_frac"       : (time - encode) / time,
+        }
+
+
+def print_breakdown(recs):
+    t = fixfmt.table.RowTable()
+    for b in breakdown(recs):
+        t.append(**b)
+
+    if len(t.rows) == 0:
+        print("no records with both file and in-memory operations")
+        return
+
+    time = fixfmt.Number(6, 1, scale="m")
+    t.fmts.update(
+        time            =time,
+        encode          =time,
+        io              =time,
+        io_frac         =fixfmt.Number(1, 3),
+    )
+    t.set_fmts()
+    t.print()
+
+
+#-------------------------------------------------------------------------------
+
+def fit_costs(recs):
+    """
+    Fits a cost model of time against data size for each operation and
+    method, from records at several lengths.
+
+    The model is a fixed overhead plus a cost per byte.  The fit minimizes
+    relative error, so that small and large sizes count equally.
+
+    Records are fit separately by configuration, schema, and host, so that
+    unrelated measurements aren't pooled into one line.
+
+    :return:
+      Iterator of dicts, one per operation, method, configuration, schema,
+      and host with at least two distinct data sizes.
+    """
+    groups = {}
+    for rec in recs:
+        # Fit warm timings only.
+        if "min" not in rec["time"]:
+            continue
+        key = (
+            rec["operation"], rec["method_name"], _get_config(rec),
+            rec.get("schema") or "", rec.get("hostname") or "",
+        )
+        groups.setdefault(key, []).append(rec)
+
+    for key, group in sorted(groups.items()):
+        operation, method_name, config, schema, hostname = key
+        sizes = np.array([ r["data_size"] for r in group ], dtype=float)
+        times = np.array([ r["time"]["min"] for r in group ])
+        if len(np.unique(sizes)) < 2:
+            continue
+        # Weighted least squares of t = overhead + per_byte * size, with
+        # weights 1/t.
+        a = np.column_stack([1 / times, sizes / times])
+        (overhead, per_byte), *_ = np.linalg.lstsq(
+            a, np.ones_like(times), rcond=None)
+        pred = overhead + per_byte * sizes
+        yield {
+            "operation"     : operation,
+            "method"        : method_name,
+            "config"        : config,
+            "schema"        : schema,
+            "hostname"      : hostname,
+            "count"         : len(group),
+            "min_size"      : sizes.min(),
+            "max_size"      : sizes.max(),
+            "overhead"      : float(overhead),
+            "per_byte"      : float(per_byte),
+            "bandwidth"     : 1 / per_byte if per_byte > 0 else float("inf"),
+            # Size at which the per-byte cost equals the fixed overhead.
+            "half_size"     : (
+                overhead / per_byte if per_byte > 0 else float("nan")),
+            "max_rel_err"   : float(np.max(np.abs(pred - times) / times)),
+        }
+
+
+def get_crossovers(fits):
+    """
+    Finds data sizes at which one method's fitted cost overtakes another's,
+    for the same operation.
+
+    :param fits:
+      Fits, as from `fit_costs`.
+    :return:
+      Iterator of dicts, one per pair of methods, fit in the same
+      configuration, whose cost lines cross at a size within the sizes to
+      which both were fit.
+    """
+    fits = list(fits)
+    for f0, f1 in itertools.combinations(fits, 2):
+        if any(
+                f0[n] != f1[n]
+                for n in ("operation", "config", "schema", "hostname")
+        ):
+            continue
+        if f0["per_byte"] == f1["per_byte"]:
+            continue
+        size = (
+            (f1["overhead"] - f0["overhead"])
+            / (f0["per_byte"] - f1["per_byte"])
+        )
+        # Don't extrapolate beyond the measured sizes.
+        if not (
+                max(f0["min_size"], f1["min_size"]) <= size
+                <= min(f0["max_size"], f1["max_size"])
+        ):
+            continue
+        # Below the crossover, the method with less overhead is faster.
+        small, large = (
+            (f0, f1) if f0["overhead"] < f1["overhead"] else (f1, f0))
+        yield {
+            "operation"     : f0["operation"],
+            "config"        : f0["config"],
+            "schema"        : f0["schema"],
+            "hostname"      : f0["hostname"],
+            "small"         : small["method"],
+            "large"         : large["method"],
+            "size"          : size,
+            "time"          : small["overhead"] + small["per_byte"] * size,
+        }
+
+
+def print_costs(recs):
+    fits = list(fit_costs(recs))
+    if len(fits) == 0:
+        print("no methods with records at several sizes")
+        return
+
+    t = fixfmt.table.RowTable()
+    for f in fits:
+        t.append(**f)
+    size = fixfmt.Number(4, 1, scale="M")
+    t.fmts.update(
+        min_size        =size,
+        max_size        =size,
+        overhead        =fixfmt.Number(6, 1, scale="m"),
+        per_byte        =fixfmt.Number(1, 3, scale="n"),
+        bandwidth       =fixfmt.Number(4, 1, scale="M"),
+        half_size       =size,
+        max_rel_err     =fixfmt.Number(1, 3),
+    )
+    t.set_fmts()
+    t.print()
+    print()
+
+    t = fixfmt.table.RowTable()
+    for c in get_crossovers(fits):
+        t.append(**c)
+    if len(t.rows) == 0:
+        print("no crossovers")
+        return
+    t.fmts.update(
+        size            =size,
+        time            =fixfmt.Number(6, 1, scale="m"),
+    )
+    t.set_fmts()
+    t.print()
+
+
 #-------------------------------------------------------------------------------
 
 import argparse
 
 def main():
     parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "mode", metavar="MODE", nargs="?",
+        choices=("summary", "compare", "costs", "breakdown"),
+        default="summary",
+        help="summarize results, compare candidate to baseline, fit costs "
+        "against data size, or break down time into encoding and I/O "
+        "[def: summary]")
     parser.add_argument(
         "--db-path", metavar="DB-PATH", default=dfio.db.DEFAULT_PATH,
         help=f"benchmark results output path [def: {dfio.db.DEFAULT_PATH}]")
@@ -69,25 +502,72 @@ def main():
     parser.add_argument(
         "--length", "-l", metavar="LEN", type=int, default=None,
         help="select tables of length LEN")
+    parser.add_argument(
+        "--hostname", metavar="HOST", default=None,
+        help="select results from HOST")
+    parser.add_argument(
+        "--since", metavar="TIMESTAMP", default=None,
+        help="select results at or after TIMESTAMP")
+    parser.add_argument(
+        "--until", metavar="TIMESTAMP", default=None,
+        help="select results before TIMESTAMP")
+    parser.add_argument(
+        "--baseline", metavar="SEL", default=None,
+        help="compare: baseline selection, as NAME=VALUE,...; NAME is run, "
+        "hostname, since, until, or a package name for its version")
+    parser.add_argument(
+        "--candidate", metavar="SEL", default=None,
+        help="compare: candidate selection, like --baseline")
+    parser.add_argument(
+        "--threshold", metavar="FRAC", type=float, default=0.05,
+        help="compare: ignore changes smaller than FRAC [def: 0.05]")
+    parser.add_argument(
+        "--level", metavar="P", type=float, default=0.95,
+        help="compare: confidence level [def: 0.95]")
     args = parser.parse_args()
 
-    recs = dfio.db.load(path=args.db_path)
-
-    # Apply filters.
-    operation = getattr(args, "operation", None)
-    if operation is not None:
-        recs = ( i for i in recs if i["operation"] == operation )
-    schema = getattr(args, "schema", None)
-    if schema is not None:
-        recs = ( i for i in recs if i["schema"] == schema )
-    method_class = getattr(args, "method_class", None)
-    if method_class is not None:
-        recs = ( i for i in recs if i["method"]["class"] == method_class )
-    length = getattr(args, "length", None)
-    if length is not None:
-        recs = ( i for i in recs if i["length"] == length )
-
-    print_summary(recs)
+    if args.mode == "compare":
+        if args.baseline is None or args.candidate is None:
+            parser.error("compare requires --baseline and --candidate")
+        try:
+            baseline = parse_selection(args.baseline)
+            candidate = parse_selection(args.candidate)
+        except ValueError as exc:
+            parser.error(str(exc))
+
+    # Filters are applied by the DB.
+    try:
+        recs = dfio.db.load(
+            path            =args.db_path,
+            operation       =args.operation,
+            schema          =args.schema,
+            method_class    =args.method_class,
+            length          =args.length,
+            hostname        =args.hostname,
+            since           =args.since,
+            until           =args.until,
+        )
+    except FileNotFoundError as exc:
+        parser.error(str(exc))
+
+    if args.mode == "summary":
+        print_summary(recs)
+
+    elif args.mode == "compare":
+        results = list(compare(
+            select(recs, baseline), select(recs, candidate),
+            threshold=args.threshold, level=args.level,
+        ))
+        print_comparison(results)
+        # Fail if anything regressed.
+        if any( r["regression"] for r in results ):
+            sys.exit(1)
+
+    elif args.mode == "costs":
+        print_costs(recs)
+
+    elif args.mode == "breakdown":
+        print_breakdown(recs)
 
 
 if __name__ == "__main__":
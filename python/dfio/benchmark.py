@@ -1,106 +1,1016 @@
 import argparse
+import concurrent.futures
+import contextlib
 import datetime
+import functools
+import importlib.metadata
+import inspect
 import itertools
+import multiprocessing
 import numpy as np
 import logging
+import pandas as pd
+import os
 from   pathlib import Path
-import pickle
+import queue
 import socket
 import tempfile
 import time
+import uuid
 
+import dfio.compact
+import dfio.datacache
+import dfio.dataset
 import dfio.db
+import dfio.instrument
+import dfio.memory
 import dfio.methods
+import dfio.query
+import dfio.stats
 
 #-------------------------------------------------------------------------------
 
-def _benchmark(fn, *, burn=1, samples=3):
-    for _ in range(burn):
-        fn()
+# Lock shared by parallel workers, if jobs are isolated.  A worker holds it for
+# the whole of each job that does file I/O, including untimed writes and
+# measurements, so no other file I/O runs while such an operation is timed.
+_isolation_lock = None
 
+# Defaults for adaptive sampling.
+ADAPTIVE = {
+    # Target width of the median's confidence interval, relative to median.
+    "rel_width"     : 0.05,
+    "level"         : 0.95,
+    # Time budget in seconds, including warm-up.
+    "budget"        : 60.0,
+    "max_samples"   : 1000,
+    # Warm-up ends when consecutive timings differ by less than this.
+    "warm_tol"      : 0.1,
+    "max_burn"      : 10,
+}
+
+def _time(fn, setup):
+    if setup is not None:
+        setup()
+    t0 = time.perf_counter()
+    fn()
+    return time.perf_counter() - t0
+
+
+def _is_converged(times, rel_width, level):
+    median, lo, hi = dfio.stats.ci(times, level=level, num=500, rng=0)
+    return hi - lo <= rel_width * median
+
+
+def _sample_adaptive(
+        fn, setup, *, samples, rel_width, level, budget, max_samples,
+        warm_tol, max_burn):
+    start = time.perf_counter()
+    over_budget = lambda: time.perf_counter() - start > budget
+
+    # Warm up until two consecutive timings agree.
+    burn = 0
+    prev = None
+    while burn < max_burn and not over_budget():
+        t = _time(fn, setup)
+        burn += 1
+        if prev is not None and abs(t - prev) <= warm_tol * min(t, prev):
+            break
+        prev = t
+
+    # Sample until the median's CI is narrow enough.  Bootstrapping isn't
+    # free, so check only as the sample count grows geometrically.
     times = []
-    for _ in range(samples):
-        t0 = time.perf_counter()
-        fn()
-        t1 = time.perf_counter()
-        times.append(t1 - t0)
+    check = samples
+    while True:
+        times.append(_time(fn, setup))
+        if len(times) >= check:
+            if _is_converged(times, rel_width, level):
+                stop = "converged"
+                break
+            check = max(check + 1, int(check * 1.2))
+        if len(times) >= max_samples:
+            stop = "max_samples"
+            break
+        if len(times) >= samples and over_budget():
+            stop = "budget"
+            break
+
+    return times, burn, stop
+
+
+def _benchmark(fn, *, burn=1, samples=3, adaptive=None, setup=None):
+    """
+    Times calls to `fn`.
+
+    :param burn:
+      Number of untimed warm-up calls, if not adaptive.
+    :param samples:
+      Number of timed calls, or the minimum number if adaptive.
+    :param adaptive:
+      If not none, sample adaptively: warm up until timings stabilize, then
+      sample until the median is known precisely enough or the time budget
+      is spent.  A dict of parameters overriding `ADAPTIVE`.
+    :param setup:
+      If not none, called untimed before each call.
+    :return:
+      Summary of timings, as for results.
+    """
+    if adaptive is None:
+        for _ in range(burn):
+            fn()
+        times = [ _time(fn, setup) for _ in range(samples) ]
+        stop = "count"
+    else:
+        times, burn, stop = _sample_adaptive(
+            fn, setup, samples=samples, **{**ADAPTIVE, **adaptive})
 
-    return times
+    return _summarize(times, burn=burn, stop=stop)
+
+
+def _evict(paths):
+    """
+    Evicts files from the OS page cache, so that the next read is cold.
+
+    :param paths:
+      Paths to regular files.
+    """
+    for path in paths:
+        try:
+            fd = os.open(path, os.O_RDONLY)
+        except FileNotFoundError:
+            continue
+        try:
+            # Dirty pages aren't evicted, so flush them first.
+            os.fdatasync(fd)
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+
+
+def _touch(df):
+    """
+    Touches all data in `df`, forcing lazily loaded data into memory.
+    """
+    total = 0
+    for _, col in df.items():
+        arr = col.to_numpy()
+        # Python objects are already in memory.
+        if arr.dtype.kind != "O":
+            total += int(np.ascontiguousarray(arr).view(np.uint8).sum())
+    return total
 
 
 def _get_data_size(df):
-    def get(name):
-        dtype = df.dtypes[name]
-        return (
-            df[name].str.len().sum() if dtype.kind == "O"
-            else len(df) * dtype.itemsize
-        )
+    def get(col):
+        dtype = col.dtype
+        if isinstance(dtype, pd.CategoricalDtype):
+            # Codes, plus the categories.
+            return col.cat.codes.nbytes + get(pd.Series(dtype.categories))
+        elif dtype.kind == "O":
+            # Python or Arrow strings.
+            return col.str.len().sum()
+        else:
+            return len(col) * dtype.itemsize
 
-    return int(sum( get(n) for n in df.dtypes.keys() ))
+    return int(sum( get(c) for _, c in df.items() ))
 
 
-def _build_results(operation, method, df, path, times):
+def _summarize(times, **info):
     return {
+        **info,
+        "count"     : len(times),
+        "min"       : float(np.min(times)),
+        "spread"    : float(np.max(times) - np.min(times)),
+        "mean"      : float(np.mean(times)),
+        "std"       : float(np.std(times)),
+        "samples"   : [ float(t) for t in times ],
+    }
+
+
+@functools.lru_cache(maxsize=None)
+def _describe_dataset(data):
+    cols = length = data_size = 0
+    for chunk in dfio.dataset.iter_chunks(data.path):
+        cols = len(chunk.dtypes)
+        length += len(chunk)
+        data_size += _get_data_size(chunk)
+    return cols, length, data_size
+
+
+def _describe(df):
+    """
+    Returns the number of columns, length, and data size of a dataframe or
+    dataset, without loading a dataset that isn't already loaded.
+    """
+    if isinstance(df, dfio.dataset.Dataset):
+        if not df.loaded:
+            return _describe_dataset(df)
+        df = df.df
+    return len(df.dtypes), len(df), _get_data_size(df)
+
+
+def _build_results(
+        operation, method, df, path, timing, *, cold_timing=None, memory=None,
+        io=None):
+    """
+    :param df:
+      The dataframe, or a `dfio.dataset.Dataset`.
+    :param path:
+      The path written, or none if in memory.
+    :param timing:
+      Timing summary, or none if only cold timings were measured.
+    :param cold_timing:
+      Timing summary with a cold page cache, if measured.
+    :param memory:
+      Memory measurements, if measured.
+    :param io:
+      I/O measurements, if measured.
+    """
+    # Warm timings are top level; with only cold timings, they're not.
+    time = {} if timing is None else dict(timing)
+    if cold_timing is not None:
+        time["cold"] = cold_timing
+    cols, length, data_size = _describe(df)
+
+    rec = {
         "operation"     : operation,
         "method"        : method.to_jso(),
         "method_name"   : str(method),
-        "cols"          : len(df.dtypes),
-        "length"        : len(df),
-        "data_size"     : _get_data_size(df),
-        "file_size"     : method.get_file_size(path),
-        "dir"           : str(path.parent),
+        "cols"          : cols,
+        "length"        : length,
+        "data_size"     : data_size,
         "timestamp"     : datetime.datetime.utcnow().isoformat(),
         "hostname"      : socket.gethostname(),
-        "time"          : {
-            "count"     : len(times),
-            "min"       : float(np.min(times)),
-            "spread"    : float(np.max(times) - np.min(times)),
-            "mean"      : float(np.mean(times)),
-            "std"       : float(np.std(times)),
-        },
+        "time"          : time,
     }
+    if path is not None:
+        rec.update(
+            file_size   =method.get_file_size(path),
+            file_count  =len(method.get_files(path)),
+            dir         =str(path.parent),
+        )
+    if memory is not None:
+        rec["memory"] = memory
+    if io is not None:
+        rec["io"] = io
+    return rec
 
 
-def benchmark_write(method, df, dir, *, samples=3):
+def benchmark_write(
+        method, df, dir, *, samples=3, adaptive=None, memory=True, io=True):
     path = Path(tempfile.mktemp(dir=dir))
     try:
-        times = _benchmark(lambda: method.write(df, path), samples=samples)
-        return _build_results("write", method, df, path, times)
+        timing = _benchmark(
+            lambda: method.write(df, path),
+            samples=samples, adaptive=adaptive)
+        mem = dfio.memory.measure(method.write, df, path) if memory else None
+        io_stats = (
+            dfio.instrument.measure(method.write, df, path) if io else None)
+        return _build_results(
+            "write", method, df, path, timing, memory=mem, io=io_stats)
     finally:
         method.clean_up(path)
 
 
-def benchmark_read(method, df, dir, *, samples=3):
+CACHE_MODES = ("warm", "cold", "both")
+
+def _benchmark_reader(
+        operation, method, df, dir, fn, *args,
+        write=None, result=None, samples=3, adaptive=None, cache="warm",
+        touch=False, lazy=None, memory=True, io=True):
+    """
+    Writes `df`, then benchmarks reading it with `fn(path, *args)`.
+
+    :param write:
+      Function to write the data to a path, if not `method.write`.
+    :param result:
+      The dataframe that `fn` returns, if not all of `df`.
+    :param cache:
+      "warm" to read from the page cache, "cold" to evict the file from the
+      page cache before each read, or "both".
+    :param touch:
+      If true, also time reads followed by a first touch of all data.  This
+      is always done for methods that read lazily.
+    :param lazy:
+      Whether `fn` returns a lazily loaded dataframe; if none,
+      `method.lazy`.  False if `fn` doesn't return a dataframe.
+    :param memory:
+      If true, also measure memory use of a read.
+    :param io:
+      If true, also measure I/O of a read.
+    """
+    if cache not in CACHE_MODES:
+        raise ValueError(f"unknown cache mode: {cache}")
+    if lazy is None:
+        lazy = method.lazy
+
+    path = Path(tempfile.mktemp(dir=dir))
+    try:
+        if write is None:
+            method.write(df, path)
+        else:
+            write(path)
+        read = lambda: fn(path, *args)
+        if result is not None:
+            # Check that a selective read, for instance with pruning, returns
+            # the same rows as selecting in memory.
+            length = len(read())
+            if length != len(result):
+                raise RuntimeError(
+                    f"{operation} returned {length} rows, not {len(result)}")
+        timing = cold_timing = None
+        if cache in ("warm", "both"):
+            timing = _benchmark(read, samples=samples, adaptive=adaptive)
+        if cache in ("cold", "both"):
+            evict = lambda: _evict(method.get_files(path))
+            cold_timing = _benchmark(
+                read, samples=samples, adaptive=adaptive, setup=evict)
+        if touch or lazy:
+            touch_timing = _benchmark(
+                lambda: _touch(read()), samples=samples, adaptive=adaptive)
+
+        # Measure I/O of one more read.
+        io_stats = None
+        if io:
+            if cache != "warm":
+                _evict(method.get_files(path))
+            io_stats = dfio.instrument.measure(read)
+
+        mem = dfio.memory.measure(fn, path, *args) if memory else None
+        rec = _build_results(
+            operation, method, df if result is None else result, path, timing,
+            cold_timing=cold_timing, memory=mem, io=io_stats)
+        rec["cache"] = cache
+        if touch or lazy:
+            rec["time"]["touch"] = touch_timing
+        if io_stats is not None:
+            # Bytes passed to read syscalls, and bytes fetched from storage.
+            rec["bytes_read"] = io_stats["proc"].get("rchar")
+            rec["storage_bytes_read"] = io_stats["proc"].get("read_bytes")
+        return rec
+    finally:
+        method.clean_up(path)
+
+
+def benchmark_read(
+        method, df, dir, *, samples=3, adaptive=None, cache="warm",
+        touch=False, memory=True, io=True):
+    return _benchmark_reader(
+        "read", method, df, dir, method.read,
+        samples=samples, adaptive=adaptive, cache=cache, touch=touch,
+        memory=memory, io=io)
+
+
+def benchmark_read_columns(
+        method, df, dir, *, columns=None,
+        samples=3, adaptive=None, cache="warm", memory=True, io=True):
+    """
+    :param columns:
+      Names of columns to read; if none, the first three.
+    """
+    if columns is None:
+        columns = list(df.columns[: 3])
+    rec = _benchmark_reader(
+        "read_columns", method, df, dir, method.read_columns, columns,
+        result=df[columns], samples=samples, adaptive=adaptive, cache=cache,
+        memory=memory, io=io)
+    rec["columns"] = columns
+    rec["projection"] = "native" if method.native_columns else "full"
+    return rec
+
+
+def benchmark_read_filtered(
+        method, df, dir, *, filters=None,
+        samples=3, adaptive=None, cache="warm", memory=True, io=True):
+    """
+    :param filters:
+      Filters, as described in `dfio.query`; if none, selects rows whose first
+      column equals its value in the first row.
+    """
+    if filters is None:
+        col = df.columns[0]
+        value = df[col].iloc[0]
+        # Unbox NumPy scalars, which SQL drivers don't accept.
+        if hasattr(value, "item"):
+            value = value.item()
+        filters = [(col, "==", value)]
+    result = dfio.query.apply(df, filters)
+
+    rec = _benchmark_reader(
+        "read_filtered", method, df, dir, method.read_filtered, filters,
+        result=result, samples=samples, adaptive=adaptive, cache=cache,
+        memory=memory, io=io)
+    rec["filter"] = dfio.query.unparse(filters)
+    rec["selectivity"] = len(result) / len(df)
+    rec["pushdown"] = (
+        "partition" if len(method.get_partition_filters(filters)) > 0
+        else "native" if method.native_filter
+        else "full"
+    )
+    return rec
+
+
+def _get_serialized_size(data):
+    """
+    Returns the size of serialized data, or none if it's not bytes-like.
+    """
+    try:
+        return memoryview(data).nbytes
+    except TypeError:
+        return None
+
+
+def benchmark_serialize(
+        method, df, dir, *, samples=3, adaptive=None, memory=True, io=True):
+    """
+    Benchmarks writing `df` to memory, without file I/O.
+    """
+    timing = _benchmark(
+        lambda: method.serialize(df), samples=samples, adaptive=adaptive)
+    size = _get_serialized_size(method.serialize(df))
+    mem = dfio.memory.measure(method.serialize, df) if memory else None
+    io_stats = dfio.instrument.measure(method.serialize, df) if io else None
+    rec = _build_results(
+        "serialize", method, df, None, timing, memory=mem, io=io_stats)
+    if size is not None:
+        rec["file_size"] = size
+    return rec
+
+
+def benchmark_deserialize(
+        method, df, dir, *, samples=3, adaptive=None, memory=True, io=True):
+    """
+    Benchmarks reading `df` from memory, without file I/O.
+    """
+    data = method.serialize(df)
+    size = _get_serialized_size(data)
+    timing = _benchmark(
+        lambda: method.deserialize(data), samples=samples, adaptive=adaptive)
+    # Handles to in-memory databases can't be sent to another process.
+    mem = (
+        dfio.memory.measure(method.deserialize, data)
+        if memory and size is not None else None
+    )
+    io_stats = dfio.instrument.measure(method.deserialize, data) if io else None
+    rec = _build_results(
+        "deserialize", method, df, None, timing, memory=mem, io=io_stats)
+    if size is not None:
+        rec["file_size"] = size
+    return rec
+
+
+DEFAULT_CHUNK_SIZE = 100000
+
+# Operations that accept a `dfio.dataset.Dataset` in place of a dataframe.
+STREAM_OPERATIONS = (
+    "write_stream",
+    "read_stream",
+)
+
+def _iter_chunks(df, chunk_size):
+    if isinstance(df, dfio.dataset.Dataset):
+        yield from df.iter_chunks(chunk_size)
+    else:
+        for i in range(0, len(df), chunk_size):
+            yield df.iloc[i : i + chunk_size]
+
+
+def _write_stream(method, df, path, chunk_size):
+    method.write_chunks(_iter_chunks(df, chunk_size), path)
+
+
+def _read_stream(method, path, chunk_size):
+    # Consume and discard chunks, as a streaming reader would.  Touch chunks
+    # that are loaded lazily, since the reader would use their data.
+    num_chunks = 0
+    for chunk in method.read_chunks(path, chunk_size):
+        if method.lazy:
+            _touch(chunk)
+        num_chunks += 1
+    return num_chunks
+
+
+def benchmark_write_stream(
+        method, df, dir, *, chunk_size=DEFAULT_CHUNK_SIZE,
+        samples=3, adaptive=None, memory=True, io=True):
+    """
+    Benchmarks writing `df` from an iterator of chunks of `chunk_size` rows.
+
+    :param df:
+      The dataframe, or a `dfio.dataset.Dataset`, which is streamed from disk
+      if it isn't loaded.
+    """
     path = Path(tempfile.mktemp(dir=dir))
-    method.write(df, path)
     try:
-        times = _benchmark(lambda: method.read(path), samples=samples)
-        return _build_results("read", method, df, path, times)
+        timing = _benchmark(
+            lambda: _write_stream(method, df, path, chunk_size),
+            samples=samples, adaptive=adaptive)
+        mem = (
+            dfio.memory.measure(_write_stream, method, df, path, chunk_size)
+            if memory else None
+        )
+        io_stats = (
+            dfio.instrument.measure(_write_stream, method, df, path, chunk_size)
+            if io else None
+        )
+        rec = _build_results(
+            "write_stream", method, df, path, timing, memory=mem, io=io_stats)
+        rec["chunk_size"] = chunk_size
+        return rec
     finally:
         method.clean_up(path)
 
 
+def benchmark_read_stream(
+        method, df, dir, *, chunk_size=DEFAULT_CHUNK_SIZE,
+        samples=3, adaptive=None, cache="warm", memory=True, io=True):
+    """
+    Benchmarks reading `df` as an iterator of chunks of `chunk_size` rows.
+
+    :param df:
+      The dataframe, or a `dfio.dataset.Dataset`, which is streamed from disk
+      if it isn't loaded.
+    """
+    rec = _benchmark_reader(
+        "read_stream", method, df, dir,
+        functools.partial(_read_stream, method), chunk_size,
+        write=lambda path: _write_stream(method, df, path, chunk_size),
+        # The read returns a chunk count, and touches lazy chunks itself.
+        lazy=False, samples=samples, adaptive=adaptive, cache=cache,
+        memory=memory, io=io)
+    rec["chunk_size"] = chunk_size
+    return rec
+
+
+DEFAULT_BATCHES = 10
+
+def _iter_batches(df, batches):
+    bounds = np.linspace(0, len(df), batches + 1).astype(int)
+    for start, stop in zip(bounds[: -1], bounds[1 :]):
+        yield df.iloc[start : stop]
+
+
+def _append_all(method, df, path, batches):
+    for batch in _iter_batches(df, batches):
+        method.append(batch, path)
+
+
+def benchmark_append(
+        method, df, dir, *, batches=DEFAULT_BATCHES, samples=3):
+    """
+    Benchmarks appending `df` in `batches` batches to a growing store.
+
+    Each sample builds a new store.  Timing is of all appends; the record
+    also has the latency of each append, with the store's size after it.
+    """
+    batch_list = list(_iter_batches(df, batches))
+    times = []
+    rows = np.cumsum([ len(b) for b in batch_list ]).tolist()
+    for _ in range(samples):
+        path = Path(tempfile.mktemp(dir=dir))
+        try:
+            sample = []
+            sizes = []
+            for batch in batch_list:
+                sample.append(_time(
+                    functools.partial(method.append, batch, path), None))
+                sizes.append(method.get_file_size(path))
+            times.append(sample)
+        finally:
+            method.clean_up(path)
+
+    times = np.array(times)
+    timing = _summarize(times.sum(axis=1), burn=0, stop="count")
+    rec = _build_results("append", method, df, None, timing)
+    rec["batches"] = batches
+    # Best latency of each append, and the store's rows and size after it.
+    rec["append"] = {
+        "latency"   : times.min(axis=0).tolist(),
+        "rows"      : rows,
+        "size"      : sizes,
+    }
+    rec["file_size"] = sizes[-1]
+    return rec
+
+
+def benchmark_read_appended(
+        method, df, dir, *, batches=DEFAULT_BATCHES,
+        samples=3, adaptive=None, cache="warm", memory=True, io=True):
+    """
+    Benchmarks reading a store built by appending `df` in `batches` batches.
+    """
+    rec = _benchmark_reader(
+        "read_appended", method, df, dir, method.read_appended,
+        write=lambda path: _append_all(method, df, path, batches),
+        samples=samples, adaptive=adaptive, cache=cache, memory=memory,
+        io=io)
+    rec["batches"] = batches
+    return rec
+
+
+DEFAULT_READERS = 4
+
+# Seconds after which concurrent reads are abandoned.
+CONCURRENT_TIMEOUT = 3600
+
+def _concurrent_reader(
+        method, path, burn, samples, barrier, results, affinity):
+    # Undo the CPU pinning of a parallel worker, so that readers can run on
+    # the CPUs that the benchmark process could.
+    if affinity is not None:
+        with contextlib.suppress(AttributeError, OSError):
+            os.sched_setaffinity(0, affinity)
+    try:
+        times = []
+        for i in range(burn + samples):
+            # Start each read at the same time as the other readers.
+            barrier.wait()
+            t0 = time.perf_counter()
+            method.read(path)
+            if i >= burn:
+                times.append(time.perf_counter() - t0)
+    except BaseException as exc:
+        # Don't leave the other readers waiting.
+        barrier.abort()
+        results.put(exc)
+    else:
+        results.put(times)
+
+
+def _read_concurrent(method, paths, *, burn=1, samples=3):
+    """
+    Reads each of `paths` in its own process, all at the same time.
+
+    :return:
+      Array of read times, indexed by sample and reader.
+    """
+    ctx = multiprocessing.get_context()
+    barrier = ctx.Barrier(len(paths))
+    results = ctx.Queue()
+    procs = [
+        ctx.Process(
+            target=_concurrent_reader,
+            args=(
+                method, p, burn, samples, barrier, results,
+                _worker.get("affinity")))
+        for p in paths
+    ]
+    for proc in procs:
+        proc.start()
+    deadline = time.monotonic() + CONCURRENT_TIMEOUT
+    times = []
+    try:
+        while len(times) < len(procs):
+            try:
+                times.append(results.get(timeout=1))
+            except queue.Empty:
+                # A reader that crashes outright never reports a result.
+                if any( p.exitcode not in (None, 0) for p in procs ):
+                    raise RuntimeError("concurrent reader failed") from None
+                if time.monotonic() > deadline:
+                    raise TimeoutError("concurrent reads timed out") from None
+    finally:
+        for proc in procs:
+            if len(times) < len(procs):
+                proc.terminate()
+            proc.join()
+
+    for t in times:
+        if isinstance(t, BaseException):
+            raise t
+    return np.array(times).T
+
+
+def benchmark_read_concurrent(
+        method, df, dir, *, readers=DEFAULT_READERS, copies=False,
+        samples=3):
+    """
+    Benchmarks `readers` processes reading at the same time.
+
+    Each sample starts all reads together, and takes as long as the slowest.
+    Scaling efficiency is throughput relative to `readers` times the
+    throughput of a single reader.  Readers may run on all CPUs available to
+    the benchmark, even when this runs in a pinned parallel worker.
+
+    :param copies:
+      If true, each reader reads its own copy of the file; otherwise, all
+      read the same file.
+    """
+    paths = [
+        Path(tempfile.mktemp(dir=dir))
+        for _ in range(readers if copies else 1)
+    ]
+    try:
+        for path in paths:
+            method.write(df, path)
+        reader_paths = (paths * readers)[: readers]
+
+        single = _read_concurrent(method, paths[: 1], samples=samples)
+        times = (
+            single if readers == 1
+            else _read_concurrent(method, reader_paths, samples=samples)
+        )
+
+        timing = _summarize(times.max(axis=1), burn=1, stop="count")
+        rec = _build_results(
+            "read_concurrent", method, df, paths[0], timing)
+        rec["readers"] = readers
+        rec["copies"] = copies
+        # Latency of individual reads, over all readers.
+        rec["latency"] = {
+            f"p{q}": float(np.percentile(times, q))
+            for q in (50, 90, 99, 100)
+        }
+        data_size = rec["data_size"]
+        throughput = readers * data_size / np.median(times.max(axis=1))
+        single_throughput = data_size / np.median(single[:, 0])
+        rec["throughput"] = float(throughput)
+        rec["efficiency"] = float(throughput / (readers * single_throughput))
+        return rec
+    finally:
+        for path in paths:
+            method.clean_up(path)
+
+
+DEFAULT_KEYS = 10
+DEFAULT_RANGE_ROWS = 10000
+
+def benchmark_lookup(
+        method, df, dir, *, key=None, keys=DEFAULT_KEYS,
+        samples=3, adaptive=None, cache="warm", memory=True, io=True):
+    """
+    Benchmarks reading all rows for `keys` random values of a key column.
+
+    For methods with native indexes, the index is built after writing, and
+    its build time, from a single sample, and size are reported separately.
+    For methods that rewrite the data to index it, the index size is that of
+    separate index files only; the sizes of all files before and after
+    building the index are also reported.
+
+    :param key:
+      Name of the key column; if none, `instr` if present, else the first
+      column.
+    :param keys:
+      Number of distinct key values to look up.
+    """
+    if key is None:
+        key = "instr" if "instr" in df.columns else df.columns[0]
+    uniques = df[key].drop_duplicates().to_numpy()
+    rng = np.random.default_rng(0)
+    values = rng.choice(uniques, min(keys, len(uniques)), replace=False)
+    # Unbox NumPy scalars, which SQL drivers don't accept.
+    values = tuple(sorted(
+        v.item() if hasattr(v, "item") else v for v in values))
+    result = df[df[key].isin(values)]
+
+    index = {}
+    def write(path):
+        method.write(df, path)
+        if method.native_index:
+            size = method.get_file_size(path)
+            index["time"] = _time(lambda: method.build_index(path, key), None)
+            file_size = method.get_file_size(path)
+            if method.index_rewrites:
+                # The data is rewritten, so its size change isn't the index's.
+                index["size"] = sum(
+                    p.stat().st_size for p in method.get_index_paths(path)
+                    if p.exists()
+                )
+            else:
+                index["size"] = file_size - size
+            # Sizes of all files before and after building the index.
+            index["write_size"] = size
+            index["file_size"] = file_size
+
+    rec = _benchmark_reader(
+        "lookup", method, df, dir, method.lookup, key, values,
+        write=write, result=result, samples=samples, adaptive=adaptive,
+        cache=cache, memory=memory, io=io)
+    rec["key"] = key
+    rec["keys"] = len(values)
+    rec["selectivity"] = len(result) / len(df)
+    rec["access"] = (
+        "index" if method.native_index
+        else "native" if method.native_filter
+        else "full"
+    )
+    if len(index) > 0:
+        rec["index"] = index
+    return rec
+
+
+def benchmark_range(
+        method, df, dir, *, range_rows=DEFAULT_RANGE_ROWS,
+        samples=3, adaptive=None, cache="warm", memory=True, io=True):
+    """
+    Benchmarks reading a contiguous slice of `range_rows` rows from the
+    middle of the data.
+    """
+    start = max(0, (len(df) - range_rows) // 2)
+    stop = min(len(df), start + range_rows)
+    rec = _benchmark_reader(
+        "range", method, df, dir, method.read_range, start, stop,
+        result=df.iloc[start : stop], samples=samples, adaptive=adaptive,
+        cache=cache, memory=memory, io=io)
+    rec["range"] = [start, stop]
+    rec["range_rows"] = range_rows
+    rec["selectivity"] = (stop - start) / len(df)
+    rec["slicing"] = "native" if method.native_range else "full"
+    return rec
+
+
+#-------------------------------------------------------------------------------
+
+def _call(fn, *args, **kw_args):
+    """
+    Calls `fn`, passing only those keyword arguments that it accepts.
+    """
+    params = inspect.signature(fn).parameters
+    kw_args = { n: v for n, v in kw_args.items() if n in params }
+    return fn(*args, **kw_args)
+
+
+def _run_job(method, operation, data, dir, **options):
+    """
+    :param data:
+      A `dfio.dataset.Dataset`, which is loaded unless the operation streams.
+    """
+    fn = globals()[f"benchmark_{operation}"]
+    df = data if operation in STREAM_OPERATIONS else data.df
+    return _call(fn, method, df, dir, **options)
+
+
+# State of a parallel worker process, set up by `_init_worker`.
+_worker = {}
+
+def _init_worker(slots, data, dir, lock):
+    global _isolation_lock
+
+    # Each worker takes its own CPUs and scratch directory.
+    index, cpus = slots.get()
+    with contextlib.suppress(AttributeError, OSError):
+        # Keep the original CPUs, for processes that the job starts.
+        _worker["affinity"] = os.sched_getaffinity(0)
+        os.sched_setaffinity(0, cpus)
+    dir = dir / f"dfio-worker-{index}"
+    dir.mkdir(exist_ok=True)
+
+    _worker.update(data=data, dir=dir)
+    _isolation_lock = lock
+
+
+# Operations without file I/O, which run concurrently even if isolated.
+IN_MEMORY_OPERATIONS = ("serialize", "deserialize")
+
+def _run_worker_job(method, operation, options):
+    lock = None if operation in IN_MEMORY_OPERATIONS else _isolation_lock
+    with lock or contextlib.nullcontext():
+        return _run_job(
+            method, operation, _worker["data"], _worker["dir"], **options)
+
+
+def _get_jobs(methods, operations, **variants):
+    """
+    Generates benchmark jobs.
+
+    :param variants:
+      Lists of values of operation options, keyed by option name.  A job is
+      generated for each value of each option that the operation accepts.
+    :return:
+      Iterator of `(method, operation, options)`.
+    """
+    for method, operation in itertools.product(methods, operations):
+        fn = globals()[f"benchmark_{operation}"]
+        params = inspect.signature(fn).parameters
+        names = [ n for n in variants if n in params ]
+        for values in itertools.product(*( variants[n] for n in names )):
+            yield method, operation, dict(zip(names, values))
+
+
+def _with_threads(methods, threads):
+    """
+    Expands methods that control threading into one per number of `threads`.
+    Other methods are included once.
+    """
+    for method in methods:
+        if method.threaded:
+            yield from ( method.with_threads(t) for t in threads )
+        else:
+            yield method
+
+
+def _get_cpus():
+    try:
+        return sorted(os.sched_getaffinity(0))
+    except AttributeError:
+        return list(range(os.cpu_count()))
+
+
+def run_parallel(
+        jobs, data, dir, *, num_jobs, cpus_per_job=1, isolated=False):
+    """
+    Runs benchmark jobs in a pool of `num_jobs` worker processes.
+
+    Each worker is pinned to `cpus_per_job` CPUs, which should be at least
+    the number of threads that jobs use, and works in its own scratch
+    subdirectory of `dir`.  If `isolated`, workers run jobs that do file I/O
+    one at a time, so that their timings don't contend for I/O with other
+    jobs' writes and measurements; in-memory jobs still run in parallel.
+
+    :param jobs:
+      Iterable of `(method, operation, options)`, where `options` are keyword
+      arguments for the benchmark function.
+    :param data:
+      A `dfio.dataset.Dataset`.  Load it first to share it with workers.
+    :return:
+      Iterator of `(method, operation, future)` in order of completion.
+    """
+    ctx = multiprocessing.get_context()
+    cpus = _get_cpus()
+    if num_jobs * cpus_per_job > len(cpus):
+        logging.warning(
+            f"{num_jobs} jobs of {cpus_per_job} CPUs share {len(cpus)} CPUs")
+    slots = ctx.Queue()
+    for i in range(num_jobs):
+        slots.put((i, {
+            cpus[(i * cpus_per_job + j) % len(cpus)]
+            for j in range(cpus_per_job)
+        }))
+    lock = ctx.Lock() if isolated else None
+
+    with concurrent.futures.ProcessPoolExecutor(
+            num_jobs, mp_context=ctx,
+            initializer=_init_worker, initargs=(slots, data, dir, lock),
+    ) as executor:
+        futures = {
+            executor.submit(_run_worker_job, m, o, p): (m, o)
+            for m, o, p in jobs
+        }
+        for future in concurrent.futures.as_completed(futures):
+            yield (*futures[future], future)
+
+    for i in range(num_jobs):
+        with contextlib.suppress(OSError):
+            (dir / f"dfio-worker-{i}").rmdir()
+
+
 #-------------------------------------------------------------------------------
 
 ALL_OPERATIONS = (
     "write",
     "read",
+    "read_columns",
+    "read_filtered",
+    "write_stream",
+    "read_stream",
+    "read_concurrent",
+    "serialize",
+    "deserialize",
+    "append",
+    "read_appended",
+    "lookup",
+    "range",
 )
 
 ALL_SCHEMAS = [
     "bars",
 ]
 
+# Packages whose versions are recorded with results.
+PACKAGES = (
+    "duckdb",
+    "fastparquet",
+    "numpy",
+    "pandas",
+    "pyarrow",
+    "tables",
+    "zstandard",
+)
+
+def get_versions():
+    versions = {}
+    for name in PACKAGES:
+        with contextlib.suppress(importlib.metadata.PackageNotFoundError):
+            versions[name] = importlib.metadata.version(name)
+    return versions
+
+
 def main():
     logging.basicConfig(level=logging.INFO)
 
     parser = argparse.ArgumentParser()
     parser.add_argument(
-        "data", metavar="PATH", type=Path, default=None,
-        help="benchmark data from pickled dataframe in PATH")
+        "data", metavar="PATH", default=None,
+        help="benchmark data from pickled dataframe or chunked dataset in "
+        "PATH, or cached generated dataset SCHEMA:LENGTH[:SEED]")
     parser.add_argument(
         "-m", "--method", metavar="CLASS", dest="method_class", default=None,
         help="select method CLASS [def: all]")
+    parser.add_argument(
+        "--grid", metavar="NAME", choices=sorted(dfio.methods.GRIDS),
+        default=None,
+        help="select methods from tuning grid NAME, one of: "
+        f"{', '.join(sorted(dfio.methods.GRIDS))} [def: all methods]")
     parser.add_argument(
         "-o", "--operation", metavar="OP", default=None,
         help="select operation OP [def: all]")
@@ -109,13 +1019,97 @@ def main():
         help="benchmark reads/writes from DIR [def: .]")
     parser.add_argument(
         "--samples", metavar="NUM", type=int, default=3,
-        help="time NUM samples per operation [def: 3]")
+        help="time NUM samples per operation, or at least NUM if adaptive "
+        "[def: 3]")
+    parser.add_argument(
+        "--adaptive", action="store_true", default=False,
+        help="sample until timings are precise or the budget is spent")
+    parser.add_argument(
+        "--rel-width", metavar="FRAC", type=float,
+        default=ADAPTIVE["rel_width"],
+        help="adaptive: target CI width of median, relative to median "
+        f"[def: {ADAPTIVE['rel_width']}]")
+    parser.add_argument(
+        "--budget", metavar="SECS", type=float, default=ADAPTIVE["budget"],
+        help="adaptive: time budget per operation [def: "
+        f"{ADAPTIVE['budget']}]")
+    parser.add_argument(
+        "--max-samples", metavar="NUM", type=int,
+        default=ADAPTIVE["max_samples"],
+        help="adaptive: time at most NUM samples [def: "
+        f"{ADAPTIVE['max_samples']}]")
+    parser.add_argument(
+        "--columns", metavar="COL[,...]", default=None,
+        help="read_columns reads columns COL,... [def: first three]")
+    parser.add_argument(
+        "--filter", metavar="EXPR", default=None,
+        help="read_filtered reads rows matching EXPR, e.g. 'instr in {1, 2}' "
+        "[def: first column equals first value]")
+    parser.add_argument(
+        "--key", metavar="COL", default=None,
+        help="lookup looks up values of COL [def: instr, or first column]")
+    parser.add_argument(
+        "--keys", metavar="NUM", type=int, default=DEFAULT_KEYS,
+        help=f"lookup looks up NUM random values [def: {DEFAULT_KEYS}]")
+    parser.add_argument(
+        "--range-rows", metavar="ROWS", type=int, default=DEFAULT_RANGE_ROWS,
+        help=f"range reads a slice of ROWS rows [def: {DEFAULT_RANGE_ROWS}]")
+    parser.add_argument(
+        "--chunk-size", metavar="ROWS[,...]", default=str(DEFAULT_CHUNK_SIZE),
+        help="stream operations use chunks of ROWS; a list runs each "
+        f"[def: {DEFAULT_CHUNK_SIZE}]")
+    parser.add_argument(
+        "--batches", metavar="NUM[,...]", default=str(DEFAULT_BATCHES),
+        help="append operations append NUM batches; a list runs each "
+        f"[def: {DEFAULT_BATCHES}]")
+    parser.add_argument(
+        "--readers", metavar="NUM[,...]", default=str(DEFAULT_READERS),
+        help="read_concurrent reads with NUM processes; a list runs each "
+        f"[def: {DEFAULT_READERS}]")
+    parser.add_argument(
+        "--copies", action="store_true", default=False,
+        help="read_concurrent readers each read their own copy of the file")
     parser.add_argument(
-        "--db-path", metavar="DB-PATH", default="./dfio-benchmark.json",
-        help="benchmark results output path [def: ./dfio-benchmark.json]")
+        "--threads", metavar="NUM[,...]", default=None,
+        help="methods that control threading use NUM threads; a list runs "
+        "each [def: library default]")
+    parser.add_argument(
+        "--compact", metavar="SETTING[,...]", default=None,
+        help="compact dtypes before benchmarking, with SETTING: "
+        f"{', '.join(dfio.compact.SETTINGS)}; a list runs each [def: none]")
+    parser.add_argument(
+        "--cache", metavar="MODE", choices=CACHE_MODES, default="warm",
+        help="read with warm or cold page cache, or both [def: warm]")
+    parser.add_argument(
+        "--touch", action="store_true", default=False,
+        help="also time a first touch of all data after read")
+    parser.add_argument(
+        "--no-memory", action="store_false", dest="memory", default=True,
+        help="don't measure memory use")
+    parser.add_argument(
+        "--no-io", action="store_false", dest="io", default=True,
+        help="don't measure I/O calls and CPU time")
+    parser.add_argument(
+        "--data-cache", metavar="DIR", type=Path,
+        default=dfio.datacache.DEFAULT_DIR,
+        help="cache generated datasets in DIR [def: "
+        f"{dfio.datacache.DEFAULT_DIR}]")
+    parser.add_argument(
+        "-j", "--jobs", metavar="NUM", type=int, default=1,
+        help="run NUM jobs in parallel [def: 1]")
+    parser.add_argument(
+        "--isolated", action="store_true", default=False,
+        help="run parallel jobs with file I/O one at a time, for uncontended "
+        "timings")
+    parser.add_argument(
+        "--db-path", metavar="DB-PATH", default=dfio.db.DEFAULT_PATH,
+        help=f"benchmark results output path [def: {dfio.db.DEFAULT_PATH}]")
     args = parser.parse_args()
 
-    methods = dfio.methods.ALL_METHODS
+    methods = (
+        dfio.methods.ALL_METHODS if args.grid is None
+        else dfio.methods.GRIDS[args.grid]
+    )
     if args.method_class is not None:
         methods = [
             m for m in methods
@@ -125,25 +1119,139 @@ def main():
 
     if not args.dir.is_dir():
         parser.error(f"not a directory: {args.dir}")
+    if args.jobs < 1:
+        parser.error(f"invalid number of jobs: {args.jobs}")
+    if args.filter is not None:
+        try:
+            filters = dfio.query.parse(args.filter)
+        except ValueError as exc:
+            parser.error(str(exc))
+    try:
+        chunk_sizes = [ int(c) for c in args.chunk_size.split(",") ]
+    except ValueError:
+        parser.error(f"invalid chunk size: {args.chunk_size}")
+    try:
+        batches = [ int(b) for b in args.batches.split(",") ]
+    except ValueError:
+        parser.error(f"invalid batches: {args.batches}")
+    if any( b < 1 for b in batches ):
+        parser.error(f"invalid batches: {args.batches}")
+    try:
+        readers = [ int(r) for r in args.readers.split(",") ]
+    except ValueError:
+        parser.error(f"invalid readers: {args.readers}")
+    if any( r < 1 for r in readers ):
+        parser.error(f"invalid readers: {args.readers}")
+    if args.keys < 1:
+        parser.error(f"invalid keys: {args.keys}")
+    if args.range_rows < 1:
+        parser.error(f"invalid range rows: {args.range_rows}")
+    compact = [None] if args.compact is None else args.compact.split(",")
+    for setting in compact:
+        if setting is not None and setting not in dfio.compact.SETTINGS:
+            parser.error(f"unknown compaction: {setting}")
+    # Give each parallel worker as many CPUs as jobs use threads.
+    cpus_per_job = 1
+    if args.threads is not None:
+        try:
+            threads = [ int(t) for t in args.threads.split(",") ]
+        except ValueError:
+            parser.error(f"invalid threads: {args.threads}")
+        if any( t < 1 for t in threads ):
+            parser.error(f"invalid threads: {args.threads}")
+        methods = list(_with_threads(methods, threads))
+        cpus_per_job = max(threads)
 
-    meta = {}
+    meta = {
+        "run"       : uuid.uuid4().hex,
+        "versions"  : get_versions(),
+    }
 
-    # Load or generate the benchmark data.
-    with open(args.data, "rb") as file:
-        df = pickle.load(file)
-    meta.update(data=args.data.name)
+    # Get the benchmark data from the cache, if it's not a path.
+    data_path = Path(args.data)
+    if not data_path.exists():
+        try:
+            schema, length, seed = dfio.datacache.parse_spec(args.data)
+        except ValueError:
+            parser.error(f"no data: {args.data}")
+        data_path = dfio.datacache.get(
+            schema, length, seed, dir=args.data_cache)
+        meta.update(schema=schema, seed=seed)
+    meta.update(data=data_path.name)
 
-    for method, operation in itertools.product(methods, operations):
-        logging.info(f"{method} {operation}")
+    # Load the benchmark data, unless all operations stream it.
+    data = dfio.dataset.Dataset(data_path)
+    if any( o not in STREAM_OPERATIONS for o in operations ):
+        data.df
+    meta.update(jobs=args.jobs, isolated=args.isolated)
+
+    options = dict(
+        samples=args.samples, cache=args.cache, touch=args.touch,
+        memory=args.memory, io=args.io, copies=args.copies, keys=args.keys,
+        range_rows=args.range_rows)
+    if args.adaptive:
+        options["adaptive"] = dict(
+            rel_width=args.rel_width, budget=args.budget,
+            max_samples=args.max_samples)
+    if args.columns is not None:
+        options["columns"] = args.columns.split(",")
+    if args.filter is not None:
+        options["filters"] = filters
+    if args.key is not None:
+        options["key"] = args.key
+
+    for setting in compact:
+        if setting is None:
+            run_data = data
+            run_meta = meta
+        else:
+            # Compacting needs the data in memory.
+            df = dfio.compact.compact(data.df, setting)
+            run_data = dfio.dataset.Dataset(df)
+            run_meta = {
+                **meta,
+                "compact"   : setting,
+                "footprint" : dfio.compact.get_footprint(df),
+            }
+
+        jobs = _get_jobs(
+            methods, operations,
+            chunk_size=chunk_sizes, batches=batches, readers=readers)
+        if args.jobs == 1:
+            for method, operation, job_options in jobs:
+                logging.info(f"{method} {operation}")
+                try:
+                    rec = _run_job(
+                        method, operation, run_data, args.dir,
+                        **{**options, **job_options})
+                except NotImplementedError as exc:
+                    logging.info(f"skipped: {operation} {method}: {exc}")
+                except Exception:
+                    logging.error(
+                        f"failed: {operation} {method}", exc_info=True)
+                else:
+                    rec.update(run_meta)
+                    dfio.db.append(rec, path=args.db_path)
 
-        fn = globals()[f"benchmark_{operation}"]
-        try:
-            rec = fn(method, df, args.dir, samples=args.samples)
-        except Exception:
-            logging.error(f"failed: {operation} {method}", exc_info=True)
         else:
-            rec.update(meta)
-            dfio.db.append(rec, path=args.db_path)
+            # Only this process appends to the DB; workers return records.
+            jobs = ( (m, o, {**options, **p}) for m, o, p in jobs )
+            for method, operation, future in run_parallel(
+                    jobs, run_data, args.dir,
+                    num_jobs=args.jobs, cpus_per_job=cpus_per_job,
+                    isolated=args.isolated
+            ):
+                try:
+                    rec = future.result()
+                except NotImplementedError as exc:
+                    logging.info(f"skipped: {operation} {method}: {exc}")
+                except Exception:
+                    logging.error(
+                        f"failed: {operation} {method}", exc_info=True)
+                else:
+                    logging.info(f"{method} {operation}")
+                    rec.update(run_meta)
+                    dfio.db.append(rec, path=args.db_path)
 
 
 if __name__ == "__main__":
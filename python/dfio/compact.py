@@ -0,0 +1,111 @@
+"""
+Dtype compaction.
+
+Converts dataframe columns to more compact dtypes, to benchmark methods on
+compacted data:
+
+- `categorical`: low-cardinality columns to categoricals, which formats that
+  support them store dictionary encoded
+- `downcast`: integers to the smallest integer dtype that holds their values,
+  and floats to float32, which may lose precision
+- `arrow_string`: string columns from Python objects to Arrow strings
+- `all`: all of these
+"""
+
+import numpy as np
+import pandas as pd
+
+#-------------------------------------------------------------------------------
+
+SETTINGS = (
+    "none",
+    "categorical",
+    "downcast",
+    "arrow_string",
+    "all",
+)
+
+# Columns with at most this many distinct values per row, and at most
+# `MAX_CATEGORIES` in total, so that codes fit in 16 bits, are categorized.
+MAX_CATEGORY_RATIO = 0.5
+MAX_CATEGORIES = 32767
+
+def _is_string(col):
+    return col.dtype.kind == "O" and not isinstance(
+        col.dtype, (pd.CategoricalDtype, pd.StringDtype))
+
+
+def _map_columns(fn, df):
+    return pd.DataFrame({ n: fn(c) for n, c in df.items() }, index=df.index)
+
+
+def categorize(
+        df, *, max_ratio=MAX_CATEGORY_RATIO, max_categories=MAX_CATEGORIES):
+    """
+    Converts string and integer columns with few distinct values to
+    categoricals.
+    """
+    def convert(col):
+        if (
+                (_is_string(col) or col.dtype.kind in "iu")
+                and col.nunique() <= min(max_ratio * len(col), max_categories)
+        ):
+            return col.astype("category")
+        else:
+            return col
+
+    return _map_columns(convert, df)
+
+
+def downcast(df):
+    """
+    Downcasts integer columns to the smallest dtype that holds their values,
+    and float columns to float32.
+    """
+    def convert(col):
+        if col.dtype.kind == "i":
+            return pd.to_numeric(col, downcast="integer")
+        elif col.dtype.kind == "u":
+            return pd.to_numeric(col, downcast="unsigned")
+        elif col.dtype.kind == "f":
+            return col.astype(np.float32)
+        else:
+            return col
+
+    return _map_columns(convert, df)
+
+
+def arrow_strings(df):
+    """
+    Converts string columns to Arrow strings.
+    """
+    return _map_columns(
+        lambda c: c.astype("string[pyarrow]") if _is_string(c) else c, df)
+
+
+def compact(df, setting):
+    """
+    Compacts `df` with one of `SETTINGS`.
+    """
+    if setting == "none":
+        return df
+    elif setting == "categorical":
+        return categorize(df)
+    elif setting == "downcast":
+        return downcast(df)
+    elif setting == "arrow_string":
+        return arrow_strings(df)
+    elif setting == "all":
+        # Categorize first, so that only high-cardinality strings remain.
+        return arrow_strings(downcast(categorize(df)))
+    else:
+        raise ValueError(f"unknown compaction: {setting}")
+
+
+def get_footprint(df):
+    """
+    Returns the memory used by `df`, including Python objects.
+    """
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
@@ -0,0 +1,228 @@
+"""
+Cache of generated benchmark datasets.
+
+Datasets are identified by schema, length, and seed, and generated in chunks
+of `CHUNK_ROWS` rows.  Each is addressed by a hash of these and the generator
+version, so changes to the generators don't reuse stale data.  Each is stored
+as a directory of Arrow IPC files, one per column, which are memory mapped
+when loaded, without copying numerical columns.  When the cache grows past
+its maximum size, the least recently used datasets are removed.
+"""
+
+import contextlib
+import hashlib
+import json
+import logging
+import os
+from   pathlib import Path
+import shutil
+import tempfile
+
+import dfio.dataset
+import dfio.gen
+
+#-------------------------------------------------------------------------------
+
+DEFAULT_DIR = Path(
+    os.environ.get("DFIO_CACHE_DIR", "~/.cache/dfio")).expanduser()
+
+DEFAULT_MAX_SIZE = 64 * 1024 ** 3
+
+# Datasets are generated in chunks of this many rows.  The data depends on it,
+# so it's part of the key.
+CHUNK_ROWS = 1000000
+
+SUFFIX = ".columns"
+
+def parse_spec(spec):
+    """
+    Parses a dataset specification `SCHEMA:LENGTH[:SEED]`.
+
+      >>> parse_spec("bars:1e6")
+      ('bars', 1000000, 0)
+
+    :return:
+      The schema, length, and seed.
+    """
+    parts = spec.split(":")
+    if not 2 <= len(parts) <= 3 or parts[0] == "":
+        raise ValueError(f"invalid dataset: {spec}")
+    try:
+        length = int(float(parts[1]))
+        seed = int(parts[2]) if len(parts) == 3 else 0
+    except ValueError:
+        raise ValueError(f"invalid dataset: {spec}") from None
+    return parts[0], length, seed
+
+
+def get_key(schema, length, seed):
+    jso = {
+        "schema"        : schema,
+        "length"        : length,
+        "seed"          : seed,
+        "version"       : dfio.gen.VERSION,
+        "chunk_rows"    : CHUNK_ROWS,
+    }
+    text = json.dumps(jso, sort_keys=True)
+    return hashlib.sha256(text.encode()).hexdigest()[: 24]
+
+
+#-------------------------------------------------------------------------------
+
+def _get_entries(dir):
+    """
+    Returns cached dataset paths, least recently used first.
+    """
+    paths = list(Path(dir).glob("*" + SUFFIX))
+    return sorted(paths, key=lambda p: p.stat().st_mtime)
+
+
+def _get_size(path):
+    return sum( p.stat().st_size for p in path.iterdir() )
+
+
+def evict(*, dir=DEFAULT_DIR, max_size=DEFAULT_MAX_SIZE, keep=()):
+    """
+    Removes least recently used datasets until the cache fits in `max_size`.
+
+    :param keep:
+      Paths not to remove.
+    """
+    entries = _get_entries(dir)
+    total = sum( _get_size(p) for p in entries )
+    for path in entries:
+        if total <= max_size:
+            break
+        if path in keep:
+            continue
+        total -= _get_size(path)
+        logging.info(f"evicting cached dataset {path.name}")
+        shutil.rmtree(path, ignore_errors=True)
+        with contextlib.suppress(FileNotFoundError):
+            path.with_suffix(".json").unlink()
+
+
+def get(
+        schema, length, seed=0, *, dir=DEFAULT_DIR, max_size=DEFAULT_MAX_SIZE,
+        jobs=1):
+    """
+    Returns the path to a cached dataset, generating it if necessary.
+
+    :param jobs:
+      Number of processes in which to generate columns.
+    """
+    dir = Path(dir)
+    key = get_key(schema, length, seed)
+    path = dir / (key + SUFFIX)
+
+    if path.exists():
+        # Mark it as recently used.
+        os.utime(path)
+    else:
+        logging.info(f"generating dataset {schema}:{length}:{seed}")
+        dir.mkdir(parents=True, exist_ok=True)
+        chunks = dfio.gen.generate_chunks(
+            dfio.gen.get_generator(schema), length, CHUNK_ROWS,
+            seed=seed, jobs=jobs)
+        # Write to a temporary directory and rename, so that concurrent runs
+        # never see a partial dataset.
+        tmp_dir = Path(tempfile.mkdtemp(dir=dir, suffix=".tmp"))
+        tmp_path = tmp_dir / "data"
+        try:
+            dfio.dataset.write(chunks, tmp_path, format="columns")
+            with open(path.with_suffix(".json"), "w") as file:
+                json.dump(
+                    {
+                        "schema"    : schema,
+                        "length"    : length,
+                        "seed"      : seed,
+                        "version"   : dfio.gen.VERSION,
+                    },
+                    file
+                )
+            try:
+                os.replace(tmp_path, path)
+            except OSError:
+                # A concurrent run renamed its copy first.
+                if not path.is_dir():
+                    raise
+        finally:
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+
+    evict(dir=dir, max_size=max_size, keep={path})
+    return path
+
+
+def list_entries(*, dir=DEFAULT_DIR):
+    """
+    Returns descriptions of cached datasets, least recently used first.
+    """
+    entries = []
+    for path in _get_entries(dir):
+        try:
+            with open(path.with_suffix(".json")) as file:
+                info = json.load(file)
+        except FileNotFoundError:
+            info = {}
+        entries.append({
+            "key"   : path.stem,
+            **info,
+            "size"  : _get_size(path),
+            "path"  : str(path),
+        })
+    return entries
+
+
+#-------------------------------------------------------------------------------
+
+import argparse
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--dir", metavar="DIR", type=Path, default=DEFAULT_DIR,
+        help=f"cache datasets in DIR [def: {DEFAULT_DIR}]")
+    parser.add_argument(
+        "--max-size", metavar="BYTES", type=float, default=DEFAULT_MAX_SIZE,
+        help=f"evict datasets beyond BYTES total [def: {DEFAULT_MAX_SIZE}]")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    cmd = commands.add_parser(
+        "get", help="generate a dataset if not cached, and print its path")
+    cmd.add_argument(
+        "spec", metavar="SCHEMA:LENGTH[:SEED]",
+        help="dataset to get; seed defaults to 0")
+    cmd.add_argument(
+        "-j", "--jobs", metavar="NUM", type=int, default=1,
+        help="generate columns in NUM processes [def: 1]")
+
+    commands.add_parser("list", help="list cached datasets")
+    commands.add_parser("evict", help="evict datasets beyond the maximum size")
+
+    args = parser.parse_args()
+
+    if args.command == "get":
+        try:
+            schema, length, seed = parse_spec(args.spec)
+        except ValueError as exc:
+            parser.error(str(exc))
+        print(get(
+            schema, length, seed,
+            dir=args.dir, max_size=args.max_size, jobs=args.jobs))
+
+    elif args.command == "list":
+        for e in list_entries(dir=args.dir):
+            print(
+                f"{e['key']}  {e.get('schema', '?')}:{e.get('length', '?')}:"
+                f"{e.get('seed', '?')}  {e['size']:>14d}")
+
+    elif args.command == "evict":
+        evict(dir=args.dir, max_size=args.max_size)
+
+
+if __name__ == "__main__":
+    main()
+
+
@@ -0,0 +1,259 @@
+"""
+Benchmark input data.
+
+Data is stored either as a single pickled dataframe or as a chunked dataset:
+an Arrow IPC stream, or a directory of Parquet files, one per chunk.  Chunked
+datasets are written and read a chunk at a time, so they may be larger than
+memory.  Arrow IPC streams are memory mapped when read; each chunk is read
+without copying, but loading the entire dataframe from more than one chunk
+copies it, to concatenate the chunks.
+
+Data may also be stored as a directory of Arrow IPC files, one per column,
+each a single record batch.  These are written one column at a time, and
+memory mapped when read, so that loading the entire dataframe doesn't copy
+numerical columns.
+"""
+
+import json
+import pandas as pd
+from   pathlib import Path
+import pickle
+
+#-------------------------------------------------------------------------------
+
+FORMATS = (
+    "pickle",
+    "ipc",
+    "parquet",
+    "columns",
+)
+
+# Arrow IPC streams start with a continuation marker.
+_IPC_MAGIC = b"\xff\xff\xff\xff"
+
+# Rows per chunk when iterating a dataset stored by column.
+COLUMNS_CHUNK_ROWS = 1000000
+
+def get_format(path):
+    path = Path(path)
+    if path.is_dir():
+        return "columns" if (path / "columns.json").exists() else "parquet"
+    with open(path, "rb") as file:
+        magic = file.read(len(_IPC_MAGIC))
+    return "ipc" if magic == _IPC_MAGIC else "pickle"
+
+
+def write(chunks, path, *, format):
+    """
+    Writes dataframe chunks to `path`.
+
+    Pickle format concatenates all chunks in memory first.
+    """
+    path = Path(path)
+
+    if format == "pickle":
+        df = pd.concat(chunks, ignore_index=True)
+        with open(path, "wb") as file:
+            pickle.dump(df, file)
+
+    elif format == "ipc":
+        import pyarrow as pa
+
+        writer = None
+        with pa.OSFile(str(path), "wb") as file:
+            try:
+                for chunk in chunks:
+                    table = pa.Table.from_pandas(chunk, preserve_index=False)
+                    if writer is None:
+                        writer = pa.ipc.new_stream(file, table.schema)
+                    writer.write_table(table)
+            finally:
+                if writer is not None:
+                    writer.close()
+
+    elif format == "parquet":
+        import pyarrow as pa
+        import pyarrow.parquet
+
+        path.mkdir()
+        for i, chunk in enumerate(chunks):
+            table = pa.Table.from_pandas(chunk, preserve_index=False)
+            pyarrow.parquet.write_table(table, path / f"part-{i:06d}.parquet")
+
+    elif format == "columns":
+        import pyarrow as pa
+
+        # Write chunks to a stream first, then copy each column from it to
+        # its own file, so that only one column is in memory at a time.
+        path.mkdir()
+        stream_path = path / "chunks.arrows"
+        write(chunks, stream_path, format="ipc")
+        try:
+            stream = pa.ipc.open_stream(pa.memory_map(str(stream_path)))
+            table = stream.read_all()
+            for i, name in enumerate(table.column_names):
+                column = pa.table([table.column(i).combine_chunks()], [name])
+                with pa.OSFile(str(path / f"{i}.arrow"), "wb") as file, \
+                     pa.ipc.new_file(file, column.schema) as writer:
+                    writer.write_table(column)
+            with open(path / "columns.json", "w") as file:
+                json.dump(table.column_names, file)
+        finally:
+            stream_path.unlink()
+
+    else:
+        raise ValueError(f"unknown format: {format}")
+
+
+def _read_columns(path):
+    """
+    Reads a dataset stored by column as a memory mapped table.
+    """
+    import pyarrow as pa
+
+    with open(path / "columns.json") as file:
+        names = json.load(file)
+    # The maps are referenced by the columns, so don't close them here.
+    columns = [
+        pa.ipc.open_file(pa.memory_map(str(path / f"{i}.arrow")))
+        .read_all().column(0)
+        for i in range(len(names))
+    ]
+    return pa.table(columns, names)
+
+
+def iter_chunks(path):
+    """
+    Reads dataframe chunks from `path`, as stored.
+    """
+    path = Path(path)
+    format = get_format(path)
+
+    if format == "pickle":
+        with open(path, "rb") as file:
+            yield pickle.load(file)
+
+    elif format == "ipc":
+        import pyarrow as pa
+
+        # Memory map, so that batches reference the file without copying.  The
+        # batches hold a reference to the map, so don't close it here.
+        for batch in pa.ipc.open_stream(pa.memory_map(str(path))):
+            yield batch.to_pandas()
+
+    elif format == "parquet":
+        import pyarrow.parquet
+
+        for part in sorted(path.glob("*.parquet")):
+            yield pyarrow.parquet.read_table(part).to_pandas()
+
+    elif format == "columns":
+        table = _read_columns(path)
+        for batch in table.to_batches(max_chunksize=COLUMNS_CHUNK_ROWS):
+            yield batch.to_pandas()
+
+
+def rechunk(chunks, chunk_size):
+    """
+    Regroups dataframe chunks into chunks of `chunk_size` rows.
+    """
+    pending = []
+    num_pending = 0
+    for chunk in chunks:
+        pending.append(chunk)
+        num_pending += len(chunk)
+        if num_pending < chunk_size:
+            continue
+        df = pd.concat(pending, ignore_index=True)
+        for i in range(0, len(df) - chunk_size + 1, chunk_size):
+            yield df.iloc[i : i + chunk_size]
+        rest = len(df) % chunk_size
+        pending = [df.iloc[len(df) - rest :]] if rest > 0 else []
+        num_pending = rest
+    if num_pending > 0:
+        yield pd.concat(pending, ignore_index=True)
+
+
+def load(path):
+    """
+    Loads the entire dataframe from `path`.
+    """
+    path = Path(path)
+    format = get_format(path)
+    if format == "pickle":
+        with open(path, "rb") as file:
+            return pickle.load(file)
+    elif format == "ipc":
+        import pyarrow as pa
+
+        # Convert the whole table at once, rather than concatenating chunks.
+        # Columns of a single batch reference the map; pandas copies to
+        # combine columns of multiple batches.
+        table = pa.ipc.open_stream(pa.memory_map(str(path))).read_all()
+        return table.to_pandas(split_blocks=True)
+    elif format == "columns":
+        # Each column is a single batch, so numerical columns reference the
+        # maps without copying.
+        return _read_columns(path).to_pandas(split_blocks=True)
+    else:
+        return pd.concat(iter_chunks(path), ignore_index=True)
+
+
+#-------------------------------------------------------------------------------
+
+class Dataset:
+    """
+    Benchmark input data, loaded lazily.
+
+    A dataset stored in chunks can be iterated without loading it.  Pickling
+    a dataset that hasn't been loaded pickles only its path.
+    """
+
+    def __init__(self, source):
+        """
+        :param source:
+          A dataframe, or the path to stored data.
+        """
+        if isinstance(source, pd.DataFrame):
+            self.path = None
+            self.__df = source
+        else:
+            self.path = Path(source)
+            self.__df = None
+
+
+    def __repr__(self):
+        return f"Dataset({self.path})"
+
+
+    @property
+    def loaded(self):
+        return self.__df is not None
+
+
+    @property
+    def df(self):
+        """
+        The entire dataframe, loaded on first access.
+        """
+        if self.__df is None:
+            self.__df = load(self.path)
+        return self.__df
+
+
+    def iter_chunks(self, chunk_size):
+        """
+        Iterates over the data in chunks of `chunk_size` rows.
+
+        If the data isn't loaded and is stored in chunks, reads it from disk
+        without loading all of it.
+        """
+        if self.loaded or get_format(self.path) == "pickle":
+            df = self.df
+            for i in range(0, len(df), chunk_size):
+                yield df.iloc[i : i + chunk_size]
+        else:
+            yield from rechunk(iter_chunks(self.path), chunk_size)
+
+
+
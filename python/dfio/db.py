@@ -1,22 +1,192 @@
+"""
+Benchmark results database.
+
+Results are stored either in SQLite, with indexed columns for common
+selections, or, for paths ending in `.json` or `.jsonl`, in the older format
+of one JSON record per line.
+"""
+
+import contextlib
+import fcntl
 import json
-import os
 from   pathlib import Path
+import sqlite3
+
+DEFAULT_PATH = "./dfio-benchmark.db"
+
+JSONL_SUFFIXES = (".json", ".jsonl")
+
+# Indexed columns, with functions to extract them from a record.
+COLUMNS = {
+    "operation"     : lambda r: r["operation"],
+    "method_class"  : lambda r: r["method"]["class"],
+    "schema"        : lambda r: r.get("schema"),
+    "length"        : lambda r: r["length"],
+    "hostname"      : lambda r: r.get("hostname"),
+    "timestamp"     : lambda r: r.get("timestamp"),
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS results (
+    id              INTEGER PRIMARY KEY,
+    operation       TEXT,
+    method_class    TEXT,
+    schema          TEXT,
+    length          INTEGER,
+    hostname        TEXT,
+    timestamp       TEXT,
+    rec             TEXT NOT NULL
+);
+""" + "".join(
+    f"CREATE INDEX IF NOT EXISTS results_{n} ON results ({n});\n"
+    for n in COLUMNS
+)
+
+#-------------------------------------------------------------------------------
+
+def _is_jsonl(path):
+    return Path(path).suffix in JSONL_SUFFIXES
+
+
+def _append_jsonl(recs, path):
+    lines = "".join( json.dumps(r) + "\n" for r in recs )
+    with open(path, "a") as file:
+        # Lock, so that concurrent benchmark runs don't interleave records.
+        fcntl.flock(file, fcntl.LOCK_EX)
+        try:
+            file.write(lines)
+        finally:
+            file.flush()
+            fcntl.flock(file, fcntl.LOCK_UN)
+
+
+def _load_jsonl(path):
+    with open(path, "r") as file:
+        return [ json.loads(l.rstrip()) for l in file ]
+
+
+@contextlib.contextmanager
+def _connect(path):
+    # Wait for other writers, rather than failing.
+    with contextlib.closing(sqlite3.connect(path, timeout=60)) as conn:
+        conn.executescript(_SCHEMA)
+        yield conn
+
+
+def _insert(conn, recs):
+    names = list(COLUMNS)
+    sql = (
+        f"INSERT INTO results ({', '.join(names)}, rec) "
+        f"VALUES ({', '.join('?' * (len(names) + 1))})"
+    )
+    with conn:
+        conn.executemany(sql, (
+            [ COLUMNS[n](r) for n in names ] + [json.dumps(r)]
+            for r in recs
+        ))
 
-DEFAULT_PATH = "./dfio-benchmark.json"
 
 #-------------------------------------------------------------------------------
 
 def append(rec, *, path=DEFAULT_PATH):
     path = Path(path)
-    with open(path, "a") as file:
-        file.write(json.dumps(rec))
-        file.write("\n")
+    if _is_jsonl(path):
+        _append_jsonl([rec], path)
+    else:
+        with _connect(path) as conn:
+            _insert(conn, [rec])
 
 
-def load(*, path=DEFAULT_PATH):
+def load(*, path=DEFAULT_PATH, since=None, until=None, **selections):
+    """
+    Loads records.
+
+    :param since:
+      If not none, select records with timestamps at or after this.
+    :param until:
+      If not none, select records with timestamps before this.
+    :param selections:
+      Values of indexed columns to select, by column name.  None values are
+      ignored.
+    """
+    selections = { n: v for n, v in selections.items() if v is not None }
+    for name in selections:
+        if name not in COLUMNS:
+            raise ValueError(f"not an indexed column: {name}")
+
     path = Path(path)
-    with open(path, "r") as file:
-        recs = [ json.loads(l.rstrip()) for l in file ]
-    return recs
+    if _is_jsonl(path):
+        def match(rec):
+            timestamp = COLUMNS["timestamp"](rec)
+            return (
+                all( COLUMNS[n](rec) == v for n, v in selections.items() )
+                and (since is None or timestamp >= since)
+                and (until is None or timestamp < until)
+            )
+
+        return [ r for r in _load_jsonl(path) if match(r) ]
+
+    else:
+        terms = [ f"{n} = ?" for n in selections ]
+        params = list(selections.values())
+        if since is not None:
+            terms.append("timestamp >= ?")
+            params.append(since)
+        if until is not None:
+            terms.append("timestamp < ?")
+            params.append(until)
+        where = "WHERE " + " AND ".join(terms) if len(terms) > 0 else ""
+
+        # Don't create an empty database for a missing path.
+        if not path.exists():
+            raise FileNotFoundError(f"no results database: {path}")
+        with _connect(path) as conn:
+            rows = conn.execute(
+                f"SELECT rec FROM results {where} ORDER BY id", params)
+            return [ json.loads(r) for r, in rows ]
+
+
+def migrate(src, dst):
+    """
+    Copies all records from the JSON lines file `src` to the database `dst`.
+
+    :return:
+      The number of records copied.
+    """
+    recs = _load_jsonl(src)
+    if _is_jsonl(dst):
+        _append_jsonl(recs, dst)
+    else:
+        with _connect(dst) as conn:
+            _insert(conn, recs)
+    return len(recs)
+
+
+#-------------------------------------------------------------------------------
+
+import argparse
+
+def main():
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    cmd = commands.add_parser(
+        "migrate", help="copy records from a JSON lines file")
+    cmd.add_argument(
+        "src", metavar="SRC", type=Path,
+        help="read JSON lines records from SRC")
+    cmd.add_argument(
+        "dst", metavar="DST", type=Path, nargs="?", default=DEFAULT_PATH,
+        help=f"append records to database DST [def: {DEFAULT_PATH}]")
+
+    args = parser.parse_args()
+
+    if args.command == "migrate":
+        num = migrate(args.src, args.dst)
+        print(f"migrated {num} records to {args.dst}")
+
+
+if __name__ == "__main__":
+    main()
 
 
@@ -1,43 +1,84 @@
 import argparse
+import concurrent.futures
 from   functools import partial
+import itertools
 import logging
 import numpy as np
 import pandas as pd
 from   pathlib import Path
-import pickle
-import random
+
+import dfio.dataset
 
 #-------------------------------------------------------------------------------
 
-def _ints(value, shape):
+# Version of generated data.  Increment this when a change to generators or
+# schemas changes the data generated from a given seed.
+VERSION = 1
+
+# Each random function takes a `np.random.Generator` and a shape, and returns
+# an array.  They are built from partials of module functions, so that they
+# can be pickled to worker processes.
+
+def _ints(value, rng, shape):
     if callable(value):
         # It's a random function.
-        return value(shape)
+        return value(rng, shape)
     else:
         # Assume it's a constant.
-        result = np.empty(shape, dtype=int)
-        result[:] = value
-        return result
+        return np.full(shape, value, dtype=int)
+
+
+def _cumsum(gen, rng, shape):
+    return gen(rng, shape).cumsum()
 
 
 def cumsum(gen):
-    return lambda n: gen(n).cumsum()
+    return partial(_cumsum, gen)
+
+
+def _boolean(rng, shape):
+    return rng.integers(0, 2, shape, dtype=np.uint8).astype(bool)
 
 
 def boolean():
-    return lambda s: np.random.randint(0, 2, s).astype(bool)
+    return _boolean
+
+
+def _normal(mu, sigma, digits, rng, shape):
+    return np.round(rng.normal(mu, sigma, shape), digits)
 
 
 def normal(mu=0, sigma=1, digits=12):
-    return lambda s: np.round(np.random.normal(mu, sigma, s), digits)
+    return partial(_normal, mu, sigma, digits)
+
+
+def _uniform(lo, hi, rng, shape):
+    return rng.uniform(lo, hi, shape)
 
 
 def uniform(lo=0, hi=1):
-    return partial(np.random.uniform, lo, hi)
+    return partial(_uniform, lo, hi)
+
+
+def _uniform_int(lo, hi, rng, shape):
+    return rng.integers(lo, hi, shape)
 
 
 def uniform_int(lo, hi):
-    return partial(np.random.randint, lo, hi)
+    return partial(_uniform_int, lo, hi)
+
+
+def _word(length, letters, rng, shape):
+    lengths = _ints(length, rng, shape).ravel()
+    width = max(int(lengths.max(initial=0)), 1)
+
+    # Draw all characters at once, as a 2D array of bytes.
+    codes = rng.integers(0, len(letters), (lengths.size, width), dtype=np.uint8)
+    chars = np.frombuffer(letters.encode(), dtype=np.uint8)[codes]
+    # Null out characters past each string's length; NumPy strips trailing
+    # nulls.  Then view each row as a fixed-width string.
+    chars[np.arange(width) >= lengths[:, None]] = 0
+    return chars.view(f"S{width}").reshape(shape).astype(f"U{width}")
 
 
 def word(length, upper=False):
@@ -48,41 +89,59 @@ def word(length, upper=False):
     letters = "abcdefghijklmnopqrstuvwxyz"
     if upper:
         letters = letters.upper()
+    return partial(_word, length, letters)
 
-    def gen(shape):
-        lengths = _ints(length, shape)
-        field_length = lengths.max()
-        dtype = "U{}".format(field_length)
 
-        result = np.empty(shape, dtype=dtype)
-        flat = result.ravel()
-        for i, l in enumerate(lengths):
-            flat[i] = "".join( random.choice(letters) for _ in range(l) )
-        return result
-
-    return gen
+def _sample(choices, rng, shape):
+    return rng.choice(choices, shape)
 
 
 def sample(choices):
     """
     Samples from `choices` with replacement.
     """
-    return partial(np.random.choice, choices)
+    return partial(_sample, choices)
+
+
+def _column(gen, seed, length):
+    return gen(np.random.default_rng(seed), length)
 
 
 def dataframe(**kw_args):
-    def gen(length):
-        columns = { n: g(length) for n, g in kw_args.items() }
-        return pd.DataFrame.from_dict(columns)
+    def gen(length, *, seed=None, jobs=1):
+        """
+        Generates a dataframe.
+
+        Each column is generated from its own random stream, derived from
+        `seed`, so the result depends only on `seed` and not on `jobs`.
+
+        :param seed:
+          Random seed or `np.random.SeedSequence`, or none for a fresh one.
+        :param jobs:
+          Number of processes in which to generate columns.
+        """
+        if not isinstance(seed, np.random.SeedSequence):
+            seed = np.random.SeedSequence(seed)
+        seeds = seed.spawn(len(kw_args))
+        args = (kw_args.values(), seeds, itertools.repeat(length))
+        if jobs == 1:
+            columns = list(map(_column, *args))
+        else:
+            with concurrent.futures.ProcessPoolExecutor(jobs) as executor:
+                columns = list(executor.map(_column, *args))
+        return pd.DataFrame.from_dict(dict(zip(kw_args, columns)))
 
     return gen
 
 
 #-------------------------------------------------------------------------------
 
+# Fixed instrument IDs, so that the schema is the same in every process.
+_INSTRS = uniform_int(1000000, 10000000)(np.random.default_rng(0), 5000)
+
 SCHEMAS = {
     "bars": {
-        "instr" : sample(uniform_int(1000000, 10000000)(5000)),
+        "instr" : sample(_INSTRS),
         "open"  : normal(digits=4),
         "high"  : normal(digits=4),
         "low"   : normal(digits=4),
@@ -119,6 +178,20 @@ def get_generator(schema):
     return dataframe(**cols)
 
 
+def generate_chunks(generator, length, chunk_rows, *, seed=None, jobs=1):
+    """
+    Generates a dataframe in chunks of `chunk_rows` rows.
+
+    Each chunk is generated from its own random stream, derived from `seed`,
+    so the result depends only on `seed` and `chunk_rows`.
+    """
+    num_chunks = -(-length // chunk_rows)
+    seeds = np.random.SeedSequence(seed).spawn(num_chunks)
+    for i, chunk_seed in enumerate(seeds):
+        rows = min(chunk_rows, length - i * chunk_rows)
+        yield generator(rows, seed=chunk_seed, jobs=jobs)
+
+
 #-------------------------------------------------------------------------------
 
 def main():
@@ -129,15 +202,32 @@ def main():
     parser.add_argument(
         "--schema", metavar="SCHEMA", default="bars",
         help="generate dataframe with SCHEMA [def: bars]")
+    parser.add_argument(
+        "--seed", metavar="SEED", type=int, default=None,
+        help="generate from random SEED [def: random]")
+    parser.add_argument(
+        "--jobs", "-j", metavar="NUM", type=int, default=1,
+        help="generate columns in NUM processes [def: 1]")
+    parser.add_argument(
+        "--chunk-rows", metavar="ROWS", type=int, default=None,
+        help="generate and write ROWS at a time [def: all at once]")
+    parser.add_argument(
+        "--format", metavar="FMT", choices=dfio.dataset.FORMATS,
+        default="pickle",
+        help="write FMT: pickle, or chunked ipc or parquet [def: pickle]")
     parser.add_argument(
         "path", metavar="PATH", type=Path,
         help="write generated dataframe to PATH")
     args = parser.parse_args()
 
     generator = get_generator(args.schema)
-    df = generator(args.length)
-    with open(args.path, "wb") as file:
-        pickle.dump(df, file)
+    if args.chunk_rows is None:
+        chunks = [generator(args.length, seed=args.seed, jobs=args.jobs)]
+    else:
+        chunks = generate_chunks(
+            generator, args.length, args.chunk_rows,
+            seed=args.seed, jobs=args.jobs)
+    dfio.dataset.write(chunks, args.path, format=args.format)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,219 @@
+"""
+I/O instrumentation.
+
+`measure` records I/O of a call from `/proc/self/io` counters, CPU time, and
+read and write calls to any file objects wrapped with `wrap_file` during it.
+"""
+
+import contextlib
+import resource
+import time
+
+#-------------------------------------------------------------------------------
+
+def get_proc_io():
+    """
+    Returns I/O counters for this process from `/proc/self/io`.
+
+    `rchar` and `wchar` count bytes passed to read and write syscalls,
+    including those satisfied from the page cache; `read_bytes` and
+    `write_bytes` count bytes actually fetched from or sent to storage.
+
+    :return:
+      A dict of counters, or none if unavailable.
+    """
+    try:
+        with open("/proc/self/io") as file:
+            lines = file.readlines()
+    except OSError:
+        return None
+    counters = {}
+    for line in lines:
+        name, _, value = line.partition(":")
+        counters[name.strip()] = int(value)
+    return counters
+
+
+@contextlib.contextmanager
+def proc_io():
+    """
+    Context manager that measures changes to `/proc/self/io` counters.
+
+    Yields a dict, which is filled in with counter changes on exit, or left
+    empty if counters are unavailable.
+    """
+    delta = {}
+    start = get_proc_io()
+    yield delta
+    end = get_proc_io()
+    if start is not None and end is not None:
+        delta.update( (n, end[n] - start[n]) for n in start )
+
+
+#-------------------------------------------------------------------------------
+
+class FileStats:
+    """
+    Counts of read and write calls to file objects, their sizes, and time
+    spent in them.
+    """
+
+    KINDS = ("read", "write")
+
+    def __init__(self):
+        self.calls = dict.fromkeys(self.KINDS, 0)
+        self.bytes = dict.fromkeys(self.KINDS, 0)
+        self.time = dict.fromkeys(self.KINDS, 0.0)
+        # Histograms of call sizes, rounded down to powers of two.
+        self.sizes = { k: {} for k in self.KINDS }
+
+
+    def add(self, kind, size, elapsed):
+        self.calls[kind] += 1
+        self.bytes[kind] += size
+        self.time[kind] += elapsed
+        bucket = 1 << (size.bit_length() - 1) if size > 0 else 0
+        hist = self.sizes[kind]
+        hist[bucket] = hist.get(bucket, 0) + 1
+
+
+    def to_jso(self):
+        return {
+            k: {
+                "calls" : self.calls[k],
+                "bytes" : self.bytes[k],
+                "time"  : self.time[k],
+                "sizes" : {
+                    str(b): n for b, n in sorted(self.sizes[k].items())
+                },
+            }
+            for k in self.KINDS
+        }
+
+
+
+class InstrumentedFile:
+    """
+    Wraps a file object, or a context manager that returns one, and records
+    read and write calls to it.
+    """
+
+    def __init__(self, file, stats):
+        self.__file = file
+        self.__target = file
+        self.__stats = stats
+
+
+    def __enter__(self):
+        self.__target = self.__file.__enter__()
+        return self
+
+
+    def __exit__(self, *exc_info):
+        return self.__file.__exit__(*exc_info)
+
+
+    def __getattr__(self, name):
+        return getattr(self.__target, name)
+
+
+    def __call(self, kind, fn, get_size, *args):
+        t0 = time.perf_counter()
+        result = fn(*args)
+        elapsed = time.perf_counter() - t0
+        self.__stats.add(kind, get_size(result, *args), elapsed)
+        return result
+
+
+    def read(self, *args):
+        return self.__call(
+            "read", self.__target.read, lambda r, *a: len(r), *args)
+
+
+    def readline(self, *args):
+        return self.__call(
+            "read", self.__target.readline, lambda r, *a: len(r), *args)
+
+
+    def readinto(self, buf):
+        return self.__call(
+            "read", self.__target.readinto, lambda r, *a: r or 0, buf)
+
+
+    def write(self, data):
+        return self.__call(
+            "write", self.__target.write,
+            lambda r, d: memoryview(d).nbytes, data)
+
+
+    def __iter__(self):
+        # Iteration bypasses `__getattr__`, so record it line by line.
+        while True:
+            line = self.readline()
+            if len(line) == 0:
+                break
+            yield line
+
+
+
+# Stats of wrapped files, while measuring.
+_file_stats = None
+
+def is_measuring():
+    """
+    Returns true while measuring, when files opened with `wrap_file` record
+    calls.
+    """
+    return _file_stats is not None
+
+
+def wrap_file(file):
+    """
+    Wraps `file` to record calls to it while measuring; otherwise, returns it
+    unchanged.
+
+    :param file:
+      A file object, or a context manager that returns one.
+    """
+    if _file_stats is None:
+        return file
+    else:
+        return InstrumentedFile(file, _file_stats)
+
+
+def measure(fn, *args):
+    """
+    Measures I/O of calling `fn(*args)`.
+
+    :return:
+      A dict with wall and CPU times; wall time not spent on CPU, which for
+      single-threaded code is mostly time blocked on I/O; changes to
+      `/proc/self/io` counters; and, if any files were wrapped, their stats.
+    """
+    global _file_stats
+
+    _file_stats = stats = FileStats()
+    ru0 = resource.getrusage(resource.RUSAGE_SELF)
+    t0 = time.perf_counter()
+    try:
+        with proc_io() as delta:
+            fn(*args)
+    finally:
+        _file_stats = None
+    wall = time.perf_counter() - t0
+    ru1 = resource.getrusage(resource.RUSAGE_SELF)
+
+    user = ru1.ru_utime - ru0.ru_utime
+    system = ru1.ru_stime - ru0.ru_stime
+    io = {
+        "wall"      : wall,
+        "user"      : user,
+        "sys"       : system,
+        "blocked"   : max(0.0, wall - user - system),
+        "proc"      : delta,
+    }
+    if sum(stats.calls.values()) > 0:
+        io["file"] = stats.to_jso()
+    return io
+
+
@@ -0,0 +1,108 @@
+import concurrent.futures
+import contextlib
+import gc
+import multiprocessing
+import resource
+import tracemalloc
+
+#-------------------------------------------------------------------------------
+
+def _get_rss():
+    """
+    Returns current and peak RSS of this process, in bytes.
+    """
+    rss = hwm = None
+    with contextlib.suppress(OSError), open("/proc/self/status") as file:
+        for line in file:
+            name, _, value = line.partition(":")
+            if name == "VmRSS":
+                rss = int(value.split()[0]) * 1024
+            elif name == "VmHWM":
+                hwm = int(value.split()[0]) * 1024
+    if hwm is None:
+        # Linux reports ru_maxrss in KiB.
+        hwm = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    return rss, hwm
+
+
+def _reset_peak_rss():
+    """
+    Resets peak RSS to current RSS, if supported.
+
+    :return:
+      True if reset.
+    """
+    try:
+        with open("/proc/self/clear_refs", "w") as file:
+            file.write("5")
+    except OSError:
+        return False
+    else:
+        return True
+
+
+def _measure_rss(fn, args):
+    gc.collect()
+    reset = _reset_peak_rss()
+    rss0, hwm0 = _get_rss()
+    result = fn(*args)
+    _, hwm1 = _get_rss()
+    del result
+    if reset and rss0 is not None:
+        return hwm1 - rss0, True
+    else:
+        # The peak may be from before the call, for instance from unpickling
+        # its arguments, so the best we can do is the growth in peak RSS,
+        # which understates the call's peak if it was lower.
+        return hwm1 - hwm0, False
+
+
+def _measure_alloc(fn, args):
+    gc.collect()
+    tracemalloc.start()
+    try:
+        result = fn(*args)
+        net, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    del result
+    return peak, net
+
+
+def _run_fresh(fn, *args):
+    """
+    Calls `fn(*args)` in a freshly spawned process.
+    """
+    ctx = multiprocessing.get_context("spawn")
+    with concurrent.futures.ProcessPoolExecutor(1, mp_context=ctx) as executor:
+        return executor.submit(fn, *args).result()
+
+
+def measure(fn, *args):
+    """
+    Measures memory used by calling `fn(*args)`.
+
+    Each measurement is made in a freshly spawned process, so that memory
+    allocated by earlier work doesn't affect it.  `fn` and `args` must be
+    picklable.  Peak RSS and tracemalloc are measured in separate processes,
+    since tracemalloc's own bookkeeping inflates RSS.
+
+    Peak RSS is measured from RSS before the call, after resetting the peak.
+    Where the peak can't be reset, as in some containers, it's the growth in
+    peak RSS, and `rss_reset` is false.
+
+    :return:
+      A dict with peak RSS growth during the call; peak bytes allocated during
+      the call, as traced by tracemalloc; and bytes allocated by the call and
+      still held after it, including the result.
+    """
+    rss_peak, rss_reset = _run_fresh(_measure_rss, fn, args)
+    alloc_peak, alloc_net = _run_fresh(_measure_alloc, fn, args)
+    return {
+        "rss_peak"      : rss_peak,
+        "rss_reset"     : rss_reset,
+        "alloc_peak"    : alloc_peak,
+        "alloc_net"     : alloc_net,
+    }
+
+
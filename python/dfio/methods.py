@@ -1,23 +1,37 @@
 import contextlib
+import copy
+import io
+import json
+import mmap
+import numpy as np
 import os
 import pandas as pd
 import pickle
+import shutil
+import struct
+import uuid
 
+import dfio.instrument
+import dfio.query
 from   dfio.lib.py import format_ctor
 
 #-------------------------------------------------------------------------------
 
 ALL_METHODS = []
 
+# Named grids of methods, for tuning one format without running all methods.
+GRIDS = {}
+
 def clean_up(path):
     with contextlib.suppress(FileNotFoundError):
         os.unlink(path)
 
 
 @contextlib.contextmanager
-def _zstd_open_write(path, level):
+def _zstd_open_write(path, level, threads=None):
     import zstd
-    compressor = zstd.ZstdCompressor(level=level)
+    kw_args = {} if threads is None else {"threads": threads}
+    compressor = zstd.ZstdCompressor(level=level, **kw_args)
     with open(path, "wb") as file, \
          compressor.stream_writer(file) as writer:
         yield writer
@@ -32,6 +46,119 @@ def _zstd_open_read(path):
         yield reader
 
 
+@contextlib.contextmanager
+def _arrow_threads(threads):
+    """
+    Sets the size of pyarrow's CPU thread pool, if `threads` is not none.
+    """
+    if threads is None:
+        yield
+        return
+
+    import pyarrow as pa
+    old = pa.cpu_count()
+    pa.set_cpu_count(threads)
+    try:
+        yield
+    finally:
+        pa.set_cpu_count(old)
+
+
+@contextlib.contextmanager
+def _blosc_threads(threads):
+    """
+    Sets the number of blosc threads for HDF5 files opened in this context,
+    if `threads` is not none.
+    """
+    if threads is None:
+        yield
+        return
+
+    import tables
+    old = tables.parameters.MAX_BLOSC_THREADS
+    # PyTables applies this when opening a file.
+    tables.parameters.MAX_BLOSC_THREADS = threads
+    try:
+        yield
+    finally:
+        tables.parameters.MAX_BLOSC_THREADS = old
+
+
+def _next_part(path, suffix):
+    """
+    Returns the path for the next file in a directory of parts, creating the
+    directory if necessary.
+    """
+    path.mkdir(exist_ok=True)
+    num = sum( 1 for _ in path.iterdir() )
+    return path / f"part-{num:06d}{suffix}"
+
+
+def _dtype_to_jso(dtype):
+    """
+    Returns a JSON representation of a pandas dtype, from which
+    `_dtype_from_jso` restores it.
+    """
+    if isinstance(dtype, pd.CategoricalDtype):
+        # The name alone would read values as strings, with categories
+        # inferred from them.
+        return {
+            "categories"    : dtype.categories.astype(str).tolist(),
+            "dtype"         : _dtype_to_jso(dtype.categories.dtype),
+            "ordered"       : bool(dtype.ordered),
+        }
+    elif isinstance(dtype, pd.StringDtype):
+        # The name omits the storage.
+        return f"string[{dtype.storage}]"
+    else:
+        return str(dtype)
+
+
+def _dtype_from_jso(jso):
+    if isinstance(jso, dict):
+        categories = pd.Index(jso["categories"]).astype(
+            _dtype_from_jso(jso["dtype"]))
+        return pd.CategoricalDtype(categories, ordered=jso["ordered"])
+    else:
+        return jso
+
+
+def _quote(name):
+    """
+    Quotes an SQL identifier.
+    """
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _write_ipc_chunks(chunks, path, compression=None):
+    import pyarrow as pa
+
+    options = pa.ipc.IpcWriteOptions(compression=compression)
+    writer = None
+    with pa.OSFile(str(path), "wb") as file:
+        try:
+            for chunk in chunks:
+                table = pa.Table.from_pandas(chunk, preserve_index=False)
+                if writer is None:
+                    writer = pa.ipc.new_file(
+                        file, table.schema, options=options)
+                writer.write_table(table)
+        finally:
+            if writer is not None:
+                writer.close()
+
+
+def _read_ipc_chunks(path):
+    """
+    Reads an Arrow IPC file as dataframes, one per record batch as written.
+    """
+    import pyarrow as pa
+
+    reader = pa.ipc.open_file(pa.memory_map(str(path)))
+    for i in range(reader.num_record_batches):
+        yield reader.get_batch(i).to_pandas()
+
+
 FILE_COMPRESSIONS = (
     "gzip",
     # "bzip2",  # Too slow; don't test this anymore.
@@ -39,7 +166,36 @@ FILE_COMPRESSIONS = (
 )
 
 
-def open_comp(path, comp, mode):
+def open_comp(path, comp, mode, *, threads=None):
+    """
+    Opens a file, compressed with `comp`.
+
+    The file is wrapped with `dfio.instrument.wrap_file`, so that calls to it
+    are recorded while measuring I/O.
+
+    :param threads:
+      Number of compression threads, if the format supports them.
+    """
+    return dfio.instrument.wrap_file(_open_comp(path, comp, mode, threads))
+
+
+@contextlib.contextmanager
+def _instrumented(path, mode):
+    """
+    Yields `path` for a library to open natively or, while measuring I/O, a
+    Python file object opened on it and wrapped to record calls.
+
+    A directory, such as a dataset of appended parts, can't be opened as a
+    file, so its path is yielded as is.
+    """
+    if dfio.instrument.is_measuring() and not os.path.isdir(path):
+        with dfio.instrument.wrap_file(open(path, mode + "b")) as file:
+            yield file
+    else:
+        yield path
+
+
+def _open_comp(path, comp, mode, threads):
     format, level = comp
     if format is None or level == None:
         return open(path, mode + "b")
@@ -54,7 +210,7 @@ def open_comp(path, comp, mode):
 
     elif format == "zstd":
         if mode == "w":
-            return _zstd_open_write(path, level)
+            return _zstd_open_write(path, level, threads)
         elif mode == "r":
             return _zstd_open_read(path)
         else:
@@ -64,23 +220,241 @@ def open_comp(path, comp, mode):
         raise ValueError(f"Unknown compression format: {format}")
 
 
+def compress(data, comp):
+    """
+    Compresses bytes in memory, with one of `FILE_COMPRESSIONS`.
+    """
+    format, level = comp
+    if format is None or level == None:
+        return data
+
+    elif format == "gzip":
+        import gzip
+        return gzip.compress(data, compresslevel=level)
+
+    elif format == "zstd":
+        import zstd
+        return zstd.ZstdCompressor(level=level).compress(data)
+
+    else:
+        raise ValueError(f"Unknown compression format: {format}")
+
+
+def decompress(data, comp, size=None):
+    """
+    Decompresses bytes compressed with `compress`.
+
+    :param size:
+      The uncompressed size, if known.
+    """
+    format, level = comp
+    if format is None or level == None:
+        return data
+
+    elif format == "gzip":
+        import gzip
+        return gzip.decompress(data)
+
+    elif format == "zstd":
+        import zstd
+        return zstd.ZstdDecompressor().decompress(
+            data, max_output_size=size or 0)
+
+    else:
+        raise ValueError(f"Unknown compression format: {format}")
+
+
 #-------------------------------------------------------------------------------
 
 class _Method:
 
+    # True if `read_columns` reads only the selected columns; otherwise, it
+    # reads the full dataframe and then selects.
+    native_columns = False
+
+    # True if `read_filtered` applies filters while reading; otherwise, it
+    # reads the full dataframe and then filters.
+    native_filter = False
+
+    # True if `read` returns data that is loaded lazily, for instance memory
+    # mapped, so that its cost is paid when the data is first touched.
+    lazy = False
+
+    # True if the method controls the number of threads its codecs or engine
+    # use.
+    threaded = False
+
+    # Number of threads, or none for the library's default.
+    threads = None
+
+    def with_threads(self, threads):
+        """
+        Returns a copy of this method that uses `threads` threads.
+        """
+        if not self.threaded:
+            raise NotImplementedError(f"{self} doesn't control threads")
+        method = copy.copy(self)
+        method.threads = threads
+        return method
+
+
+    def get_paths(self, path):
+        """
+        Returns the paths of all files or directories written for `path`.
+        """
+        return [path]
+
+
+    def get_files(self, path):
+        """
+        Returns the paths of all files written for `path`, recursively.
+        """
+        files = []
+        for p in self.get_paths(path):
+            if p.is_dir():
+                files.extend( f for f in sorted(p.rglob("*")) if f.is_file() )
+            elif p.exists():
+                files.append(p)
+        return files
+
+
     def get_file_size(self, path):
-        return path.stat().st_size
+        return sum( p.stat().st_size for p in self.get_files(path) )
 
 
     def clean_up(self, path):
-        with contextlib.suppress(FileNotFoundError):
-            os.unlink(path)
+        for p in self.get_paths(path):
+            if p.is_dir():
+                shutil.rmtree(p)
+            else:
+                with contextlib.suppress(FileNotFoundError):
+                    os.unlink(p)
 
 
     def to_jso(self):
-        return {
+        jso = {
             "class"     : self.__class__.__name__,
         }
+        if self.threads is not None:
+            jso["threads"] = self.threads
+        return jso
+
+
+    def read_columns(self, path, columns):
+        """
+        Reads only `columns`.
+        """
+        return self.read(path)[columns]
+
+
+    def read_filtered(self, path, filters):
+        """
+        Reads only rows that match `filters`.
+
+        :param filters:
+          Filters, as described in `dfio.query`.
+        """
+        return dfio.query.apply(self.read(path), filters)
+
+
+    def get_partition_filters(self, filters):
+        """
+        Returns filter terms on partition keys implied by `filters`, which
+        let reads skip partitions.
+
+        :return:
+          Additional filter terms; empty if the method isn't partitioned.
+        """
+        return []
+
+
+    def serialize(self, df):
+        """
+        Serializes a dataframe in memory, without file I/O.
+
+        :return:
+          A bytes-like object or, if the engine can't export bytes, an
+          in-memory handle that `deserialize` accepts.
+        """
+        raise NotImplementedError(f"{self} doesn't serialize in memory")
+
+
+    def deserialize(self, data):
+        """
+        Deserializes a dataframe from the result of `serialize`.
+        """
+        raise NotImplementedError(f"{self} doesn't serialize in memory")
+
+
+    def write_chunks(self, chunks, path):
+        """
+        Writes a dataframe from an iterable of chunks, without holding the
+        whole dataframe in memory.
+        """
+        raise NotImplementedError(f"{self} doesn't write chunks")
+
+
+    def read_chunks(self, path, chunk_size):
+        """
+        Reads a dataframe as an iterator of chunks of about `chunk_size` rows,
+        without holding the whole dataframe in memory.
+        """
+        raise NotImplementedError(f"{self} doesn't read chunks")
+
+
+    def append(self, df, path):
+        """
+        Appends `df` to the store at `path`, creating it if it doesn't exist,
+        without rewriting data already stored.
+        """
+        raise NotImplementedError(f"{self} doesn't append")
+
+
+    def read_appended(self, path):
+        """
+        Reads all data in a store written by `append`.
+        """
+        return self.read(path)
+
+
+    # True if `build_index` builds an index with which `lookup` reads only
+    # matching rows.
+    native_index = False
+
+    def build_index(self, path, column):
+        """
+        Builds an index on `column` of the data written to `path`, in place.
+        """
+        raise NotImplementedError(f"{self} doesn't build indexes")
+
+
+    # True if `build_index` rewrites the data, for instance sorted by key,
+    # rather than adding an index to it.
+    index_rewrites = False
+
+    def get_index_paths(self, path):
+        """
+        Returns the paths of index files kept apart from the data.
+        """
+        return []
+
+
+    def lookup(self, path, column, values):
+        """
+        Reads all rows whose `column` value is one of `values`.
+        """
+        return self.read_filtered(path, [(column, "in", tuple(values))])
+
+
+    # True if `read_range` reads only the selected rows; otherwise, it reads
+    # the full dataframe and then slices.
+    native_range = False
+
+    def read_range(self, path, start, stop):
+        """
+        Reads rows from position `start` up to `stop`.
+        """
+        return self.read(path).iloc[start : stop]
 
 
 
@@ -88,13 +462,24 @@ class _Method:
 
 class Pickle(_Method):
 
-    def __init__(self, *, comp=(None, 0), protocol=pickle.HIGHEST_PROTOCOL):
+    def __init__(
+            self, *, comp=(None, 0), protocol=pickle.HIGHEST_PROTOCOL,
+            threads=None):
         self.comp = comp
         self.protocol = protocol
+        self.threads = threads
 
 
     def __repr__(self):
-        return format_ctor(self, comp=self.comp, protocol=self.protocol)
+        kw_args = {} if self.threads is None else {"threads": self.threads}
+        return format_ctor(
+            self, comp=self.comp, protocol=self.protocol, **kw_args)
+
+
+    @property
+    def threaded(self):
+        # Only zstd compresses with multiple threads.
+        return self.comp[0] == "zstd"
 
 
     def to_jso(self):
@@ -106,7 +491,7 @@ class Pickle(_Method):
 
 
     def write(self, df, path):
-        with open_comp(path, self.comp, "w") as file:
+        with open_comp(path, self.comp, "w", threads=self.threads) as file:
             pickle.dump(df, file, protocol=self.protocol)
 
 
@@ -115,6 +500,31 @@ class Pickle(_Method):
             return pickle.load(file)
 
 
+    def serialize(self, df):
+        return compress(pickle.dumps(df, protocol=self.protocol), self.comp)
+
+
+    def deserialize(self, data):
+        return pickle.loads(decompress(data, self.comp))
+
+
+    def write_chunks(self, chunks, path):
+        with open_comp(path, self.comp, "w", threads=self.threads) as file:
+            for chunk in chunks:
+                pickle.dump(chunk, file, protocol=self.protocol)
+
+
+    def read_chunks(self, path, chunk_size):
+        # Chunks are read as written.
+        with open_comp(path, self.comp, "r") as file:
+            while True:
+                try:
+                    yield pickle.load(file)
+                except EOFError:
+                    break
+
+
+
 
 ALL_METHODS.append(Pickle())
 ALL_METHODS.extend(
@@ -125,17 +535,21 @@ ALL_METHODS.extend(
 
 #-------------------------------------------------------------------------------
 
-class PandasCSV(_Method):
+class Pickle5OOB(_Method):
+    """
+    Pickle protocol 5, with buffers stored out of band.
 
-    COMPRESSIONS = (
-        None,
-        "gzip",
-        "bz2",
-        "bz2",
-        "xz",
-    )
+    The file starts with a table of segments: the pickle stream, then each
+    buffer it references.  Each segment is aligned to 64 bytes and optionally
+    compressed.  Uncompressed buffers are memory mapped on read, rather than
+    copied.
+    """
+
+    MAGIC = b"DFIOPK5\0"
+
+    ALIGN = 64
 
-    def __init__(self, *, comp=None):
+    def __init__(self, *, comp=(None, 0)):
         self.comp = comp
 
 
@@ -143,6 +557,11 @@ class PandasCSV(_Method):
         return format_ctor(self, comp=self.comp)
 
 
+    @property
+    def lazy(self):
+        return self.comp[0] is None or self.comp[1] is None
+
+
     def to_jso(self):
         return {
             **super().to_jso(),
@@ -150,235 +569,1875 @@ class PandasCSV(_Method):
         }
 
 
-    def write(self, df, path):
-        df.to_csv(path, compression=self.comp)
-
+    def _align(self, offset):
+        return -(-offset // self.ALIGN) * self.ALIGN
 
-    def read(self, path):
-        import pandas as pd
-        return pd.read_csv(path, compression=self.comp)
 
+    def _dump(self, df, file):
+        buffers = []
+        data = pickle.dumps(df, protocol=5, buffer_callback=buffers.append)
+        raws = [data] + [ b.raw() for b in buffers ]
+        segments = [ compress(r, self.comp) for r in raws ]
 
+        # Lay out segments after the table.
+        offset = self._align(len(self.MAGIC) + 8 + 24 * len(segments))
+        table = []
+        for raw, segment in zip(raws, segments):
+            table.append((offset, len(segment), len(raw)))
+            offset = self._align(offset + len(segment))
 
-ALL_METHODS.append(PandasCSV())
-ALL_METHODS.extend( PandasCSV(comp=c) for c in PandasCSV.COMPRESSIONS )
+        file.write(self.MAGIC)
+        file.write(struct.pack("<Q", len(segments)))
+        for entry in table:
+            file.write(struct.pack("<QQQ", *entry))
+        for (offset, _, _), segment in zip(table, segments):
+            file.write(b"\0" * (offset - file.tell()))
+            file.write(segment)
 
-#-------------------------------------------------------------------------------
 
-class PandasHDF5(_Method):
+    def _load(self, view):
+        if view[: len(self.MAGIC)] != self.MAGIC:
+            raise ValueError(f"not {self.__class__.__name__} data")
 
-    COMPLIBS = (
-        "zlib",
-        "lzo",
-        "bzip2",
-        "blosc",
-        "blosc:blosclz",
-        "blosc:lz4",
-        "blosc:lz4hc",
-        "blosc:snappy",
-        "blosc:zlib",
-        "blosc:zstd",
-    )
+        start = len(self.MAGIC)
+        num, = struct.unpack_from("<Q", view, start)
+        table = [
+            struct.unpack_from("<QQQ", view, start + 8 + 24 * i)
+            for i in range(num)
+        ]
+        segments = [
+            decompress(view[o : o + s], self.comp, r)
+            for o, s, r in table
+        ]
+        return pickle.loads(segments[0], buffers=segments[1 :])
 
-    def __init__(self, *, comp=("zlib", 0), engine="fixed"):
-        self.comp = comp
-        self.engine = engine
 
+    def write(self, df, path):
+        with dfio.instrument.wrap_file(open(path, "wb")) as file:
+            self._dump(df, file)
 
-    def __repr__(self):
-        return format_ctor(self, comp=self.comp, engine=self.engine)
 
+    def read(self, path):
+        with open(path, "rb") as file:
+            # Copy on write, so that arrays are writable.
+            file_map = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY)
+        # The arrays hold references to the map, so don't close it here.
+        return self._load(memoryview(file_map))
 
-    def to_jso(self):
-        return {
-            **super().to_jso(),
-            "comp"      : list(self.comp),
-            "engine"    : self.engine,
-        }
 
+    def serialize(self, df):
+        buf = io.BytesIO()
+        self._dump(df, buf)
+        return buf.getvalue()
 
-    def write(self, df, path):
-        complib, complevel = self.comp
-        # FIXME
-        clean_up(path)
-        df.to_hdf(
-            path, mode="w", key="dataframe",
-            format=self.engine,
-            complib=complib, complevel=complevel,
-        )
 
+    def deserialize(self, data):
+        return self._load(memoryview(data))
 
-    def read(self, path):
-        import pandas as pd
-        return pd.read_hdf(path, key="dataframe")
 
 
 
+ALL_METHODS.append(Pickle5OOB())
 ALL_METHODS.extend(
-    PandasHDF5(engine=f)
-    for f in ("table", "fixed")
-)
-ALL_METHODS.extend(
-    PandasHDF5(comp=(c, l), engine=f)
-    for f in ("table", "fixed")
-    for c in PandasHDF5.COMPLIBS
+    Pickle5OOB(comp=(c, l))
+    for c in FILE_COMPRESSIONS
     for l in (1, 5, 9)
 )
 
 #-------------------------------------------------------------------------------
 
-class Parquet(_Method):
+class PandasCSV(_Method):
+
+    COMPRESSIONS = (
+        None,
+        "gzip",
+        "bz2",
+        "bz2",
+        "xz",
+    )
 
-    def __init__(self, *, comp=None, engine="pyarrow"):
+    def __init__(self, *, comp=None, engine="c", typed=False):
+        """
+        :param engine:
+          Parser engine for reads.
+        :param typed:
+          If true, store dtypes alongside the file, and read with them rather
+          than inferring them.
+        """
         self.comp = comp
         self.engine = engine
+        self.typed = typed
 
 
     def __repr__(self):
-        return format_ctor(self, comp=self.comp, engine=self.engine)
+        kw_args = {}
+        if self.engine != "c":
+            kw_args.update(engine=self.engine)
+        if self.typed:
+            kw_args.update(typed=True)
+        return format_ctor(self, comp=self.comp, **kw_args)
 
 
     def to_jso(self):
-        return {
+        jso = {
             **super().to_jso(),
             "comp"      : self.comp,
-            "engine"    : self.engine,
         }
+        if self.engine != "c":
+            jso["engine"] = self.engine
+        if self.typed:
+            jso["typed"] = True
+        return jso
+
+
+    def _get_dtypes_path(self, path):
+        return path.parent / (path.name + ".dtypes.json")
+
+
+    def get_paths(self, path):
+        paths = [path]
+        if self.typed:
+            paths.append(self._get_dtypes_path(path))
+        return paths
+
+
+    def _write_dtypes(self, df, path):
+        if self.typed:
+            with open(self._get_dtypes_path(path), "w") as file:
+                json.dump(
+                    {
+                        str(n): _dtype_to_jso(t)
+                        for n, t in df.dtypes.items()
+                    },
+                    file
+                )
+
+
+    def _get_read_args(self, path):
+        # The first column is the index, as written by `to_csv`.
+        kw_args = dict(compression=self.comp, engine=self.engine, index_col=0)
+        if self.typed:
+            with open(self._get_dtypes_path(path)) as file:
+                dtypes = json.load(file)
+            kw_args.update(dtype={
+                n: _dtype_from_jso(t) for n, t in dtypes.items() })
+        return kw_args
 
 
     def write(self, df, path):
-        df.to_parquet(
-            path,
-            engine=self.engine,
-            compression=self.comp,
-        )
+        with _instrumented(path, "w") as file:
+            df.to_csv(file, compression=self.comp)
+        self._write_dtypes(df, path)
 
 
     def read(self, path):
         import pandas as pd
-        return pd.read_parquet(path, engine=self.engine)
+        kw_args = self._get_read_args(path)
+        with _instrumented(path, "r") as file:
+            return pd.read_csv(file, **kw_args)
+
+
+    native_columns = True
+
+    def read_columns(self, path, columns):
+        import pandas as pd
+        kw_args = self._get_read_args(path)
+        # The index isn't among the selected columns.
+        del kw_args["index_col"]
+        with _instrumented(path, "r") as file:
+            return pd.read_csv(file, usecols=columns, **kw_args)
+
+
+    def serialize(self, df):
+        if self.typed:
+            raise NotImplementedError("typed CSV stores dtypes in a file")
+        buf = io.BytesIO()
+        df.to_csv(buf, compression=self.comp)
+        return buf.getvalue()
+
+
+    def deserialize(self, data):
+        import pandas as pd
+        return pd.read_csv(
+            io.BytesIO(data), compression=self.comp, engine=self.engine,
+            index_col=0)
+
+
+    def write_chunks(self, chunks, path):
+        # Compressed streams may be concatenated, so just append each chunk.
+        for i, chunk in enumerate(chunks):
+            chunk.to_csv(
+                path, mode="a" if i > 0 else "w", header=i == 0,
+                compression=self.comp,
+            )
+            if i == 0:
+                self._write_dtypes(chunk, path)
+
+
+    def read_chunks(self, path, chunk_size):
+        if self.engine == "pyarrow":
+            raise NotImplementedError("pyarrow engine doesn't read chunks")
+
+        import pandas as pd
+        with pd.read_csv(
+                path, chunksize=chunk_size, **self._get_read_args(path)
+        ) as reader:
+            yield from reader
 
 
 
+
+ALL_METHODS.append(PandasCSV())
+ALL_METHODS.extend( PandasCSV(comp=c) for c in PandasCSV.COMPRESSIONS )
 ALL_METHODS.extend(
-    Parquet(comp=c, engine=e)
-    for c in (None, "gzip", "snappy", "brotli", )  # zstd?
-    for e in ("pyarrow", "fastparquet", )
+    PandasCSV(engine=e, typed=t)
+    for e in ("c", "pyarrow", )
+    for t in (False, True, )
+    if (e, t) != ("c", False)
 )
 
 #-------------------------------------------------------------------------------
 
-class Feather(_Method):
+class ArrowCSV(_Method):
+    """
+    CSV written and read with `pyarrow.csv`, multithreaded.
+
+    The index is not stored.
+    """
 
     COMPRESSIONS = (
-        "uncompressed",
-        "lz4",
+        None,
+        "gzip",
         "zstd",
     )
 
-    def __init__(self, comp="uncompressed"):
+    def __init__(self, *, comp=None, typed=False, threads=None):
+        """
+        :param typed:
+          If true, store the Arrow schema alongside the file, and read with it
+          rather than inferring types.
+        """
         self.comp = comp
+        self.typed = typed
+        self.threads = threads
 
 
     def __repr__(self):
-        return format_ctor(self, comp=self.comp)
+        kw_args = {}
+        if self.typed:
+            kw_args.update(typed=True)
+        if self.threads is not None:
+            kw_args.update(threads=self.threads)
+        return format_ctor(self, comp=self.comp, **kw_args)
 
 
+    threaded = True
+
     def to_jso(self):
-        return {
+        jso = {
             **super().to_jso(),
             "comp"      : self.comp,
         }
+        if self.typed:
+            jso["typed"] = True
+        return jso
 
 
-    def write(self, df, path):
-        import pyarrow.feather
-        pyarrow.feather.write_feather(df, path, compression=self.comp)
+    def _get_schema_path(self, path):
+        return path.parent / (path.name + ".schema")
 
 
-    def read(self, path):
-        import pyarrow.feather
-        return pyarrow.feather.read_feather(path)
+    def get_paths(self, path):
+        paths = [path]
+        if self.typed:
+            paths.append(self._get_schema_path(path))
+        return paths
 
-        
 
-ALL_METHODS.extend( Feather(c) for c in Feather.COMPRESSIONS )
+    def _open(self, path, mode):
+        import pyarrow as pa
+        if dfio.instrument.is_measuring():
+            file = dfio.instrument.wrap_file(open(path, mode + "b"))
+        else:
+            file = pa.OSFile(str(path), mode + "b")
+        if self.comp is not None:
+            file = (
+                pa.CompressedOutputStream(file, self.comp) if mode == "w"
+                else pa.CompressedInputStream(file, self.comp)
+            )
+        return file
 
-#-------------------------------------------------------------------------------
 
-class SQLite(_Method):
+    def _write_schema(self, schema, path):
+        if self.typed:
+            with open(self._get_schema_path(path), "wb") as file:
+                file.write(schema.serialize().to_pybytes())
 
-    def __repr__(self):
-        return format_ctor(self)
 
+    def _get_convert_options(self, path, columns=None):
+        import pyarrow as pa
+        import pyarrow.csv
 
-    def to_jso(self):
-        return {
-            **super().to_jso(),
-        }
+        kw_args = {}
+        if self.typed:
+            with open(self._get_schema_path(path), "rb") as file:
+                schema = pa.ipc.read_schema(pa.py_buffer(file.read()))
+            kw_args.update(column_types=schema)
+        if columns is not None:
+            kw_args.update(include_columns=columns)
+        return pyarrow.csv.ConvertOptions(**kw_args)
 
 
     def write(self, df, path):
-        import sqlite3
+        import pyarrow as pa
+        import pyarrow.csv
 
-        clean_up(path)
-        with sqlite3.connect(path) as conn:
-            df.to_sql("dataframe", conn, if_exists="fail")
+        with _arrow_threads(self.threads):
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            with self._open(path, "w") as file:
+                pyarrow.csv.write_csv(table, file)
+        self._write_schema(table.schema, path)
 
 
-    def read(self, path):
-        import sqlite3
+    def _read(self, path, columns=None):
+        import pyarrow.csv
 
-        with sqlite3.connect(path) as conn:
-            return pd.read_sql("SELECT * FROM dataframe", conn)
+        with _arrow_threads(self.threads), self._open(path, "r") as file:
+            table = pyarrow.csv.read_csv(
+                file,
+                convert_options=self._get_convert_options(path, columns))
+            return table.to_pandas()
 
 
+    def read(self, path):
+        return self._read(path)
 
-ALL_METHODS.append(SQLite())
 
-#-------------------------------------------------------------------------------
+    native_columns = True
 
-class DuckDB(_Method):
+    def read_columns(self, path, columns):
+        return self._read(path, columns)
 
-    def __repr__(self):
-        return format_ctor(self)
 
+    def write_chunks(self, chunks, path):
+        import pyarrow as pa
+        import pyarrow.csv
 
-    def get_file_size(self, path):
-        size = path.stat().st_size
-        wal_path = path.parent / (path.name + ".wal")
-        with contextlib.suppress(FileNotFoundError):
-            size += wal_path.stat().st_size
-        return size
+        writer = None
+        with _arrow_threads(self.threads), self._open(path, "w") as file:
+            try:
+                for chunk in chunks:
+                    table = pa.Table.from_pandas(chunk, preserve_index=False)
+                    if writer is None:
+                        writer = pyarrow.csv.CSVWriter(file, table.schema)
+                        self._write_schema(table.schema, path)
+                    writer.write_table(table)
+            finally:
+                if writer is not None:
+                    writer.close()
 
 
-    def clean_up(self, path):
-        super().clean_up(path)
-        wal_path = path.parent / (path.name + ".wal")
-        with contextlib.suppress(FileNotFoundError):
-            os.unlink(wal_path)
+    def read_chunks(self, path, chunk_size):
+        import pyarrow.csv
 
+        # Chunks are blocks of the file, as parsed.
+        with _arrow_threads(self.threads), self._open(path, "r") as file:
+            reader = pyarrow.csv.open_csv(
+                file, convert_options=self._get_convert_options(path))
+            for batch in reader:
+                yield batch.to_pandas()
 
-    def write(self, df, path):
-        import duckdb
 
-        clean_up(path)
-        with contextlib.closing(duckdb.connect(str(path))) as con:
-            con.register("df_view", df)
-            con.execute("CREATE TABLE df_table AS SELECT * FROM df_view")
-            con.unregister("df_view")
 
 
-    def read(self, path):
+ALL_METHODS.extend( ArrowCSV(comp=c) for c in ArrowCSV.COMPRESSIONS )
+ALL_METHODS.append(ArrowCSV(typed=True))
+
+#-------------------------------------------------------------------------------
+
+class PandasHDF5(_Method):
+
+    COMPLIBS = (
+        "zlib",
+        "lzo",
+        "bzip2",
+        "blosc",
+        "blosc:blosclz",
+        "blosc:lz4",
+        "blosc:lz4hc",
+        "blosc:snappy",
+        "blosc:zlib",
+        "blosc:zstd",
+    )
+
+    def __init__(
+            self, *, comp=("zlib", 0), engine="fixed", data_columns=None,
+            threads=None):
+        """
+        :param data_columns:
+          For table format, columns to make queryable; true for all.
+        :param threads:
+          Number of blosc threads.
+        """
+        self.comp = comp
+        self.engine = engine
+        self.data_columns = data_columns
+        self.threads = threads
+
+
+    def __repr__(self):
+        kw_args = {}
+        if self.data_columns is not None:
+            kw_args.update(data_columns=self.data_columns)
+        if self.threads is not None:
+            kw_args.update(threads=self.threads)
+        return format_ctor(self, comp=self.comp, engine=self.engine, **kw_args)
+
+
+    @property
+    def threaded(self):
+        return self.comp[0].startswith("blosc")
+
+
+    def to_jso(self):
+        jso = {
+            **super().to_jso(),
+            "comp"      : list(self.comp),
+            "engine"    : self.engine,
+        }
+        if self.data_columns is not None:
+            jso["data_columns"] = self.data_columns
+        return jso
+
+
+    def write(self, df, path):
+        complib, complevel = self.comp
+        kw_args = {}
+        if self.data_columns is not None:
+            kw_args.update(data_columns=self.data_columns)
+        # FIXME
+        clean_up(path)
+        with _blosc_threads(self.threads):
+            df.to_hdf(
+                path, mode="w", key="dataframe",
+                format=self.engine,
+                complib=complib, complevel=complevel,
+                **kw_args
+            )
+
+
+    def read(self, path):
+        import pandas as pd
+        with _blosc_threads(self.threads):
+            return pd.read_hdf(path, key="dataframe")
+
+
+    @property
+    def native_columns(self):
+        # Only table format supports column selection.
+        return self.engine == "table"
+
+
+    def read_columns(self, path, columns):
+        if not self.native_columns:
+            return super().read_columns(path, columns)
+
+        import pandas as pd
+        with _blosc_threads(self.threads):
+            return pd.read_hdf(path, key="dataframe", columns=columns)
+
+
+    @property
+    def native_filter(self):
+        return self.engine == "table" and bool(self.data_columns)
+
+
+    def read_filtered(self, path, filters):
+        cols = dfio.query.get_columns(filters)
+        if not (
+                self.native_filter
+                and (self.data_columns is True or cols <= set(self.data_columns))
+        ):
+            return super().read_filtered(path, filters)
+
+        import pandas as pd
+        with _blosc_threads(self.threads):
+            return pd.read_hdf(
+                path, key="dataframe", where=dfio.query.to_hdf(filters))
+
+
+    @property
+    def native_index(self):
+        return self.native_filter
+
+
+    def build_index(self, path, column):
+        if not (
+                self.native_filter
+                and (self.data_columns is True or column in self.data_columns)
+        ):
+            raise NotImplementedError(f"{column} isn't a queryable column")
+
+        import pandas as pd
+        # Writing indexes data columns with a medium index; replace it with a
+        # completely sorted index.
+        with _blosc_threads(self.threads), pd.HDFStore(path, mode="a") as store:
+            store.create_table_index(
+                "dataframe", columns=[column], optlevel=9, kind="full")
+
+
+    # Both formats read row slices.
+    native_range = True
+
+    def read_range(self, path, start, stop):
+        import pandas as pd
+        with _blosc_threads(self.threads):
+            return pd.read_hdf(path, key="dataframe", start=start, stop=stop)
+
+
+    # HDF5 files in memory, with the core driver, need a name but aren't
+    # written to disk.
+    CORE_NAME = "dfio-in-memory.h5"
+
+    def serialize(self, df):
+        import pandas as pd
+        complib, complevel = self.comp
+        kw_args = {}
+        if self.data_columns is not None:
+            kw_args.update(data_columns=self.data_columns)
+        with _blosc_threads(self.threads), pd.HDFStore(
+                self.CORE_NAME, mode="w", complib=complib, complevel=complevel,
+                driver="H5FD_CORE", driver_core_backing_store=0,
+        ) as store:
+            store.put("dataframe", df, format=self.engine, **kw_args)
+            store.flush()
+            return store._handle.get_file_image()
+
+
+    def deserialize(self, data):
+        import pandas as pd
+        with _blosc_threads(self.threads), pd.HDFStore(
+                self.CORE_NAME, mode="r",
+                driver="H5FD_CORE", driver_core_image=data,
+                driver_core_backing_store=0,
+        ) as store:
+            return store.get("dataframe")
+
+
+    def write_chunks(self, chunks, path):
+        if self.engine != "table":
+            raise NotImplementedError("only table format appends")
+
+        import pandas as pd
+        complib, complevel = self.comp
+        kw_args = {}
+        if self.data_columns is not None:
+            kw_args.update(data_columns=self.data_columns)
+        clean_up(path)
+        with _blosc_threads(self.threads), pd.HDFStore(
+                path, mode="w", complib=complib, complevel=complevel
+        ) as store:
+            for chunk in chunks:
+                store.append("dataframe", chunk, **kw_args)
+
+
+    def read_chunks(self, path, chunk_size):
+        if self.engine != "table":
+            raise NotImplementedError("only table format reads chunks")
+
+        import pandas as pd
+        with _blosc_threads(self.threads), pd.HDFStore(path, mode="r") as store:
+            yield from store.select("dataframe", chunksize=chunk_size)
+
+
+    def append(self, df, path):
+        if self.engine != "table":
+            raise NotImplementedError("only table format appends")
+
+        import pandas as pd
+        complib, complevel = self.comp
+        kw_args = {}
+        if self.data_columns is not None:
+            kw_args.update(data_columns=self.data_columns)
+        with _blosc_threads(self.threads), pd.HDFStore(
+                path, mode="a", complib=complib, complevel=complevel
+        ) as store:
+            store.append("dataframe", df, **kw_args)
+
+
+
+
+ALL_METHODS.extend(
+    PandasHDF5(engine=f)
+    for f in ("table", "fixed")
+)
+ALL_METHODS.extend(
+    PandasHDF5(comp=(c, l), engine=f)
+    for f in ("table", "fixed")
+    for c in PandasHDF5.COMPLIBS
+    for l in (1, 5, 9)
+)
+# Queryable tables, for filtered reads.
+ALL_METHODS.extend(
+    PandasHDF5(comp=c, engine="table", data_columns=True)
+    for c in (("zlib", 0), ("blosc:lz4", 5))
+)
+
+#-------------------------------------------------------------------------------
+
+class Parquet(_Method):
+
+    # Writer options, for the pyarrow engine only, and their defaults.
+    TUNING = {
+        "row_group_size"        : None,
+        "data_page_size"        : None,
+        "use_dictionary"        : True,
+        "compression_level"     : None,
+        "use_byte_stream_split" : False,
+        "write_statistics"      : True,
+    }
+
+    def __init__(
+            self, *, comp=None, engine="pyarrow", threads=None,
+            row_group_size=None, data_page_size=None, use_dictionary=True,
+            compression_level=None, use_byte_stream_split=False,
+            write_statistics=True):
+        """
+        :param row_group_size:
+          Maximum rows per row group.
+        :param data_page_size:
+          Target size of data pages, in bytes.
+        :param use_dictionary:
+          Whether to dictionary encode, or names of columns to encode.
+        :param use_byte_stream_split:
+          Whether to use byte stream split encoding for float columns, or
+          names of columns to encode.
+        :param write_statistics:
+          Whether to write column statistics, or names of columns for which
+          to write them.
+        """
+        self.comp = comp
+        self.engine = engine
+        self.threads = threads
+        self.row_group_size = row_group_size
+        self.data_page_size = data_page_size
+        self.use_dictionary = use_dictionary
+        self.compression_level = compression_level
+        self.use_byte_stream_split = use_byte_stream_split
+        self.write_statistics = write_statistics
+        if engine != "pyarrow" and len(self.tuning) > 0:
+            raise ValueError("writer options require pyarrow engine")
+
+
+    @property
+    def tuning(self):
+        """
+        Writer options that differ from defaults.
+        """
+        return {
+            n: getattr(self, n)
+            for n, d in self.TUNING.items()
+            if getattr(self, n) != d
+        }
+
+
+    def __repr__(self):
+        kw_args = {} if self.threads is None else {"threads": self.threads}
+        return format_ctor(
+            self, comp=self.comp, engine=self.engine, **kw_args, **self.tuning)
+
+
+    @property
+    def threaded(self):
+        return self.engine == "pyarrow"
+
+
+    def to_jso(self):
+        return {
+            **super().to_jso(),
+            "comp"      : self.comp,
+            "engine"    : self.engine,
+            **self.tuning,
+        }
+
+
+    def _get_writer_args(self, df):
+        """
+        Returns pyarrow writer arguments for tuning options.
+        """
+        args = self.tuning
+        args.pop("row_group_size", None)
+        if args.get("use_byte_stream_split") is True:
+            # Only floats can be encoded this way.
+            args["use_byte_stream_split"] = [
+                str(n) for n, t in df.dtypes.items() if t.kind == "f" ]
+        return args
+
+
+    def _open(self, path, mode):
+        # fastparquet opens files itself.
+        return (
+            _instrumented(path, mode) if self.engine == "pyarrow"
+            else contextlib.nullcontext(path)
+        )
+
+
+    def write(self, df, path):
+        kw_args = {}
+        if self.engine == "pyarrow":
+            kw_args.update(self._get_writer_args(df))
+            if self.row_group_size is not None:
+                kw_args.update(row_group_size=self.row_group_size)
+        with _arrow_threads(self.threads), self._open(path, "w") as file:
+            df.to_parquet(
+                file,
+                engine=self.engine,
+                compression=self.comp,
+                **kw_args
+            )
+
+
+    def read(self, path):
+        import pandas as pd
+        with _arrow_threads(self.threads), self._open(path, "r") as file:
+            return pd.read_parquet(file, engine=self.engine)
+
+
+    native_columns = True
+
+    def read_columns(self, path, columns):
+        import pandas as pd
+        with _arrow_threads(self.threads), self._open(path, "r") as file:
+            return pd.read_parquet(file, engine=self.engine, columns=columns)
+
+
+    native_filter = True
+
+    def read_filtered(self, path, filters):
+        import pandas as pd
+        with _arrow_threads(self.threads):
+            df = pd.read_parquet(
+                path, engine=self.engine, filters=dfio.query.to_arrow(filters))
+        if self.engine != "pyarrow":
+            # Other engines use filters only to skip row groups.
+            df = dfio.query.apply(df, filters)
+        return df
+
+
+    # Rows per row group when sorting for an index, unless `row_group_size`
+    # is set.
+    INDEX_ROW_GROUP_SIZE = 65536
+
+    native_index = True
+    index_rewrites = True
+
+    def build_index(self, path, column):
+        # Sort by the key and rewrite, so that each row group covers a narrow
+        # range of keys, and filtered reads skip the rest by their statistics.
+        # Drop the shuffled index, which would otherwise be stored as an extra
+        # column.
+        df = (
+            self.read(path).sort_values(column, kind="stable")
+            .reset_index(drop=True)
+        )
+        row_group_size = self.row_group_size or self.INDEX_ROW_GROUP_SIZE
+        kw_args = {}
+        if self.engine == "pyarrow":
+            kw_args.update(
+                self._get_writer_args(df), row_group_size=row_group_size)
+        else:
+            kw_args.update(row_group_offsets=row_group_size)
+        with _arrow_threads(self.threads):
+            df.to_parquet(
+                path,
+                engine=self.engine,
+                compression=self.comp,
+                **kw_args
+            )
+
+
+    @property
+    def native_range(self):
+        return self.engine == "pyarrow"
+
+
+    def read_range(self, path, start, stop):
+        if not self.native_range:
+            return super().read_range(path, start, stop)
+
+        import pyarrow.parquet
+        with _arrow_threads(self.threads):
+            file = pyarrow.parquet.ParquetFile(path)
+            # Read only the row groups that overlap the range.
+            groups = []
+            offset = first = 0
+            for i in range(file.num_row_groups):
+                rows = file.metadata.row_group(i).num_rows
+                if offset < stop and start < offset + rows:
+                    if len(groups) == 0:
+                        first = offset
+                    groups.append(i)
+                offset += rows
+            table = file.read_row_groups(groups, use_pandas_metadata=True)
+            return table.slice(start - first, stop - start).to_pandas()
+
+
+    def serialize(self, df):
+        if self.engine != "pyarrow":
+            raise NotImplementedError("only pyarrow serializes in memory")
+
+        import pyarrow as pa
+        import pyarrow.parquet
+
+        with _arrow_threads(self.threads):
+            table = pa.Table.from_pandas(df)
+            sink = pa.BufferOutputStream()
+            pyarrow.parquet.write_table(
+                table, sink,
+                compression="none" if self.comp is None else self.comp,
+                row_group_size=self.row_group_size,
+                **self._get_writer_args(df))
+            return sink.getvalue()
+
+
+    def deserialize(self, data):
+        import pyarrow as pa
+        import pyarrow.parquet
+
+        with _arrow_threads(self.threads):
+            table = pyarrow.parquet.read_table(pa.BufferReader(data))
+            return table.to_pandas()
+
+
+    def write_chunks(self, chunks, path):
+        if self.engine == "pyarrow":
+            import pyarrow as pa
+            import pyarrow.parquet
+
+            writer = None
+            with _arrow_threads(self.threads):
+                try:
+                    for chunk in chunks:
+                        table = pa.Table.from_pandas(
+                            chunk, preserve_index=False)
+                        if writer is None:
+                            writer = pyarrow.parquet.ParquetWriter(
+                                path, table.schema,
+                                compression="none" if self.comp is None
+                                else self.comp,
+                                **self._get_writer_args(chunk)
+                            )
+                        writer.write_table(
+                            table, row_group_size=self.row_group_size)
+                finally:
+                    if writer is not None:
+                        writer.close()
+
+        else:
+            import fastparquet
+            for i, chunk in enumerate(chunks):
+                fastparquet.write(
+                    str(path), chunk, compression=self.comp, append=i > 0)
+
+
+    def read_chunks(self, path, chunk_size):
+        if self.engine == "pyarrow":
+            import pyarrow.parquet
+            with _arrow_threads(self.threads):
+                file = pyarrow.parquet.ParquetFile(path)
+                for batch in file.iter_batches(batch_size=chunk_size):
+                    yield batch.to_pandas()
+
+        else:
+            # Chunks are row groups, as written.
+            import fastparquet
+            yield from fastparquet.ParquetFile(str(path)).iter_row_groups()
+
+
+    def append(self, df, path):
+        if self.engine == "pyarrow":
+            # Each append writes a new file in a dataset directory, which
+            # `read` reads as a whole.
+            import pyarrow as pa
+            import pyarrow.parquet
+
+            with _arrow_threads(self.threads):
+                table = pa.Table.from_pandas(df, preserve_index=False)
+                pyarrow.parquet.write_table(
+                    table, _next_part(path, ".parquet"),
+                    compression="none" if self.comp is None else self.comp,
+                    row_group_size=self.row_group_size,
+                    **self._get_writer_args(df))
+
+        else:
+            # fastparquet appends row groups to the file.
+            import fastparquet
+            fastparquet.write(
+                str(path), df, compression=self.comp, append=path.exists())
+
+
+    def read_appended(self, path):
+        if self.engine == "pyarrow":
+            import pyarrow.dataset
+
+            with _arrow_threads(self.threads):
+                dataset = pyarrow.dataset.dataset(path, format="parquet")
+                return dataset.to_table().to_pandas()
+
+        else:
+            return self.read(path)
+
+
+
+
+ALL_METHODS.extend(
+    Parquet(comp=c, engine=e)
+    for c in (None, "gzip", "snappy", "brotli", "zstd", )
+    for e in ("pyarrow", "fastparquet", )
+)
+
+GRIDS["parquet-row-groups"] = [
+    Parquet(comp="zstd", row_group_size=n)
+    for n in (16384, 65536, 262144, 1048576, )
+]
+GRIDS["parquet-pages"] = [
+    Parquet(comp="zstd", data_page_size=n)
+    for n in (65536, 1048576, 8388608, )
+]
+GRIDS["parquet-encoding"] = [
+    Parquet(comp="zstd", use_dictionary=d, use_byte_stream_split=b)
+    for d in (True, False, )
+    for b in (False, True, )
+]
+GRIDS["parquet-zstd"] = [
+    Parquet(comp="zstd", compression_level=l)
+    for l in (1, 3, 9, 19, )
+]
+GRIDS["parquet-statistics"] = [
+    Parquet(comp="zstd", write_statistics=s)
+    for s in (True, False, )
+]
+
+#-------------------------------------------------------------------------------
+
+class Feather(_Method):
+
+    COMPRESSIONS = (
+        "uncompressed",
+        "lz4",
+        "zstd",
+    )
+
+    def __init__(self, comp="uncompressed", *, mmap=False, threads=None):
+        """
+        :param mmap:
+          If true, read by memory mapping the file.  Unless uncompressed, data
+          is still decompressed into memory.
+        """
+        self.comp = comp
+        self.mmap = mmap
+        self.threads = threads
+
+
+    def __repr__(self):
+        kw_args = {"mmap": True} if self.mmap else {}
+        if self.threads is not None:
+            kw_args.update(threads=self.threads)
+        return format_ctor(self, comp=self.comp, **kw_args)
+
+
+    threaded = True
+
+    def get_paths(self, path):
+        return [path, self._get_index_path(path)]
+
+
+    def get_index_paths(self, path):
+        return [self._get_index_path(path)]
+
+
+    def _get_index_path(self, path):
+        return path.parent / (path.name + ".index.json")
+
+
+
+    @property
+    def lazy(self):
+        return self.mmap and self.comp == "uncompressed"
+
+
+    def to_jso(self):
+        jso = {
+            **super().to_jso(),
+            "comp"      : self.comp,
+        }
+        if self.mmap:
+            jso["mmap"] = True
+        return jso
+
+
+    def write(self, df, path):
+        import pyarrow.feather
+        # When memory mapped, write a single record batch, so that reading
+        # doesn't concatenate and copy batches.
+        kw_args = {"chunksize": max(1, len(df))} if self.mmap else {}
+        with _arrow_threads(self.threads), _instrumented(path, "w") as file:
+            pyarrow.feather.write_feather(
+                df, file, compression=self.comp, **kw_args)
+
+
+    def read(self, path):
+        import pyarrow.feather
+        with _arrow_threads(self.threads):
+            if self.mmap:
+                # Avoid copying column data into pandas blocks where possible.
+                table = pyarrow.feather.read_table(path, memory_map=True)
+                return table.to_pandas(split_blocks=True)
+            else:
+                with _instrumented(path, "r") as file:
+                    return pyarrow.feather.read_feather(file)
+
+
+    native_columns = True
+
+    def read_columns(self, path, columns):
+        import pyarrow.feather
+        with _arrow_threads(self.threads):
+            return pyarrow.feather.read_feather(path, columns=columns)
+
+
+    def serialize(self, df):
+        import pyarrow as pa
+        import pyarrow.feather
+
+        with _arrow_threads(self.threads):
+            sink = pa.BufferOutputStream()
+            pyarrow.feather.write_feather(df, sink, compression=self.comp)
+            return sink.getvalue()
+
+
+    def deserialize(self, data):
+        import pyarrow as pa
+        import pyarrow.feather
+
+        with _arrow_threads(self.threads):
+            table = pyarrow.feather.read_table(pa.BufferReader(data))
+            return table.to_pandas(split_blocks=self.mmap)
+
+
+    def write_chunks(self, chunks, path):
+        # Feather V2 is the Arrow IPC file format.
+        with _arrow_threads(self.threads):
+            _write_ipc_chunks(
+                chunks, path,
+                compression=None if self.comp == "uncompressed" else self.comp)
+
+
+    def read_chunks(self, path, chunk_size):
+        # Chunks are record batches, as written.
+        with _arrow_threads(self.threads):
+            yield from _read_ipc_chunks(path)
+
+
+    def append(self, df, path):
+        # Each append writes a new file in a directory.
+        import pyarrow as pa
+        import pyarrow.feather
+
+        with _arrow_threads(self.threads):
+            table = pa.Table.from_pandas(df, preserve_index=False)
+            pyarrow.feather.write_feather(
+                table, _next_part(path, ".feather"), compression=self.comp)
+
+
+    def read_appended(self, path):
+        import pyarrow.dataset
+
+        with _arrow_threads(self.threads):
+            dataset = pyarrow.dataset.dataset(path, format="feather")
+            return dataset.to_table().to_pandas()
+
+
+    # Rows per record batch when sorting for an index.
+    INDEX_CHUNK_ROWS = 65536
+
+    native_index = True
+    index_rewrites = True
+
+    def build_index(self, path, column):
+        # Sort by the key and rewrite in record batches of known size, so that
+        # each key's rows are contiguous.  A sidecar file records the offsets
+        # of each key's rows.
+        import pyarrow.feather
+
+        with _arrow_threads(self.threads):
+            table = pyarrow.feather.read_table(path).sort_by(column)
+            pyarrow.feather.write_feather(
+                table, path, compression=self.comp,
+                chunksize=self.INDEX_CHUNK_ROWS)
+
+        keys = table[column].to_numpy()
+        starts = np.flatnonzero(np.r_[True, keys[1 :] != keys[: -1]])
+        stops = np.r_[starts[1 :], len(keys)]
+        offsets = zip(keys[starts].tolist(), starts.tolist(), stops.tolist())
+        with open(self._get_index_path(path), "w") as file:
+            json.dump(
+                {
+                    "column"    : column,
+                    "chunk_rows": self.INDEX_CHUNK_ROWS,
+                    "offsets"   : list(offsets),
+                },
+                file
+            )
+
+
+    def lookup(self, path, column, values):
+        try:
+            with open(self._get_index_path(path)) as file:
+                index = json.load(file)
+        except FileNotFoundError:
+            index = None
+        if index is None or index["column"] != column:
+            return super().lookup(path, column, values)
+
+        import pyarrow as pa
+
+        offsets = { k: (s, e) for k, s, e in index["offsets"] }
+        ranges = sorted( offsets[v] for v in values if v in offsets )
+        chunk_rows = index["chunk_rows"]
+        with _arrow_threads(self.threads):
+            reader = pa.ipc.open_file(pa.memory_map(str(path)))
+            # Read only the record batches that contain the keys' rows.
+            batches = {}
+            slices = []
+            for start, stop in ranges:
+                first, last = start // chunk_rows, (stop - 1) // chunk_rows
+                for i in range(first, last + 1):
+                    if i not in batches:
+                        batches[i] = reader.get_batch(i)
+                    offset = i * chunk_rows
+                    lo = max(start, offset) - offset
+                    hi = min(stop, offset + chunk_rows) - offset
+                    slices.append(batches[i].slice(lo, hi - lo))
+            table = pa.Table.from_batches(slices, schema=reader.schema)
+            return table.to_pandas()
+
+
+    @property
+    def native_range(self):
+        # Only uncompressed data is sliced from the map without decompressing
+        # the rest.
+        return self.comp == "uncompressed"
+
+
+    def read_range(self, path, start, stop):
+        import pyarrow.feather
+        with _arrow_threads(self.threads):
+            table = pyarrow.feather.read_table(path, memory_map=True)
+            return table.slice(start, stop - start).to_pandas()
+
+
+        
+
+ALL_METHODS.extend( Feather(c) for c in Feather.COMPRESSIONS )
+ALL_METHODS.append(Feather(mmap=True))
+
+#-------------------------------------------------------------------------------
+
+class ArrowIPC(_Method):
+    """
+    Arrow IPC file, memory mapped on read.
+
+    Column data is not copied on read, except for strings, which pandas
+    stores as Python objects.
+    """
+
+    lazy = True
+
+    def __init__(self, *, threads=None):
+        self.threads = threads
+
+
+    def __repr__(self):
+        kw_args = {} if self.threads is None else {"threads": self.threads}
+        return format_ctor(self, **kw_args)
+
+
+    threaded = True
+
+    def write(self, df, path):
+        import pyarrow as pa
+
+        with _arrow_threads(self.threads):
+            table = pa.Table.from_pandas(df)
+            with pa.OSFile(str(path), "wb") as file, \
+                 pa.ipc.new_file(file, table.schema) as writer:
+                writer.write_table(table)
+
+
+    def read(self, path):
+        import pyarrow as pa
+
+        with _arrow_threads(self.threads):
+            # The table holds a reference to the map, so don't close it here.
+            table = pa.ipc.open_file(pa.memory_map(str(path))).read_all()
+            return table.to_pandas(split_blocks=True)
+
+
+    def serialize(self, df):
+        import pyarrow as pa
+
+        with _arrow_threads(self.threads):
+            table = pa.Table.from_pandas(df)
+            sink = pa.BufferOutputStream()
+            with pa.ipc.new_file(sink, table.schema) as writer:
+                writer.write_table(table)
+            return sink.getvalue()
+
+
+    def deserialize(self, data):
+        import pyarrow as pa
+
+        with _arrow_threads(self.threads):
+            table = pa.ipc.open_file(pa.BufferReader(data)).read_all()
+            return table.to_pandas(split_blocks=True)
+
+
+    def write_chunks(self, chunks, path):
+        with _arrow_threads(self.threads):
+            _write_ipc_chunks(chunks, path)
+
+
+    def read_chunks(self, path, chunk_size):
+        # Chunks are record batches, as written.
+        with _arrow_threads(self.threads):
+            yield from _read_ipc_chunks(path)
+
+
+    def append(self, df, path):
+        # Each append writes a new file in a directory.
+        with _arrow_threads(self.threads):
+            _write_ipc_chunks([df], _next_part(path, ".arrow"))
+
+
+    def read_appended(self, path):
+        import pyarrow.dataset
+
+        with _arrow_threads(self.threads):
+            dataset = pyarrow.dataset.dataset(path, format="ipc")
+            return dataset.to_table().to_pandas(split_blocks=True)
+
+
+    native_range = True
+
+    def read_range(self, path, start, stop):
+        import pyarrow as pa
+
+        with _arrow_threads(self.threads):
+            table = pa.ipc.open_file(pa.memory_map(str(path))).read_all()
+            return table.slice(start, stop - start).to_pandas(split_blocks=True)
+
+
+
+
+ALL_METHODS.append(ArrowIPC())
+
+#-------------------------------------------------------------------------------
+
+class NumpyDir(_Method):
+    """
+    Directory of raw `.npy` files, one per column, memory mapped on read.
+
+    String columns are stored as fixed-width Unicode arrays, which pandas
+    copies into Python objects on read.  The index is not stored.
+    """
+
+    lazy = True
+
+    def __repr__(self):
+        return format_ctor(self)
+
+
+    def write(self, df, path):
+        self.clean_up(path)
+        path.mkdir()
+        for i, (_, col) in enumerate(df.items()):
+            arr = col.to_numpy()
+            if arr.dtype.kind == "O":
+                arr = arr.astype(str)
+            np.save(path / f"{i}.npy", arr, allow_pickle=False)
+        with open(path / "columns.json", "w") as file:
+            json.dump([ str(n) for n in df.columns ], file)
+
+
+    def read(self, path):
+        with open(path / "columns.json") as file:
+            names = json.load(file)
+        return pd.DataFrame(
+            {
+                n: np.load(path / f"{i}.npy", mmap_mode="r")
+                for i, n in enumerate(names)
+            },
+            copy=False
+        )
+
+
+    native_range = True
+
+    def read_range(self, path, start, stop):
+        with open(path / "columns.json") as file:
+            names = json.load(file)
+        df = pd.DataFrame({
+            n: np.load(path / f"{i}.npy", mmap_mode="r")[start : stop]
+            for i, n in enumerate(names)
+        })
+        # Label rows as `read` would.
+        df.index += start
+        return df
+
+
+
+ALL_METHODS.append(NumpyDir())
+
+#-------------------------------------------------------------------------------
+
+class SQLite(_Method):
+
+    def __repr__(self):
+        return format_ctor(self)
+
+
+    def to_jso(self):
+        return {
+            **super().to_jso(),
+        }
+
+
+    def write(self, df, path):
+        import sqlite3
+
+        clean_up(path)
+        with sqlite3.connect(path) as conn:
+            df.to_sql("dataframe", conn, if_exists="fail")
+
+
+    def read(self, path):
+        import sqlite3
+
+        with sqlite3.connect(path) as conn:
+            return pd.read_sql("SELECT * FROM dataframe", conn)
+
+
+    native_columns = True
+
+    def read_columns(self, path, columns):
+        import sqlite3
+
+        cols = ", ".join( _quote(c) for c in columns )
+        with sqlite3.connect(path) as conn:
+            return pd.read_sql(f"SELECT {cols} FROM dataframe", conn)
+
+
+    native_filter = True
+
+    def read_filtered(self, path, filters):
+        import sqlite3
+
+        where, params = dfio.query.to_sql(filters, _quote)
+        with sqlite3.connect(path) as conn:
+            return pd.read_sql(
+                f"SELECT * FROM dataframe WHERE {where}", conn, params=params)
+
+
+    def serialize(self, df):
+        import sqlite3
+
+        with contextlib.closing(sqlite3.connect(":memory:")) as conn:
+            df.to_sql("dataframe", conn, if_exists="fail")
+            if not hasattr(conn, "serialize"):
+                raise NotImplementedError("requires Python 3.11")
+            return conn.serialize()
+
+
+    def deserialize(self, data):
+        import sqlite3
+
+        with contextlib.closing(sqlite3.connect(":memory:")) as conn:
+            conn.deserialize(data)
+            return pd.read_sql("SELECT * FROM dataframe", conn)
+
+
+    def write_chunks(self, chunks, path):
+        import sqlite3
+
+        clean_up(path)
+        with sqlite3.connect(path) as conn:
+            for i, chunk in enumerate(chunks):
+                chunk.to_sql(
+                    "dataframe", conn, if_exists="append" if i > 0 else "fail")
+
+
+    def read_chunks(self, path, chunk_size):
+        import sqlite3
+
+        with sqlite3.connect(path) as conn:
+            yield from pd.read_sql(
+                "SELECT * FROM dataframe", conn, chunksize=chunk_size)
+
+
+    def append(self, df, path):
+        import sqlite3
+
+        with sqlite3.connect(path) as conn:
+            df.to_sql("dataframe", conn, if_exists="append")
+
+
+    native_index = True
+
+    def build_index(self, path, column):
+        import sqlite3
+
+        name = _quote(f"dataframe_{column}")
+        with sqlite3.connect(path) as conn:
+            conn.execute(f"CREATE INDEX {name} ON dataframe ({_quote(column)})")
+
+
+    native_range = True
+
+    def read_range(self, path, start, stop):
+        import sqlite3
+
+        # Rows are inserted in order, with rowids from 1.
+        with sqlite3.connect(path) as conn:
+            return pd.read_sql(
+                "SELECT * FROM dataframe WHERE rowid > ? AND rowid <= ?", conn,
+                params=(start, stop))
+
+
+
+
+ALL_METHODS.append(SQLite())
+
+#-------------------------------------------------------------------------------
+
+class DuckDB(_Method):
+
+    def __init__(self, *, threads=None):
+        self.threads = threads
+
+
+    def __repr__(self):
+        kw_args = {} if self.threads is None else {"threads": self.threads}
+        return format_ctor(self, **kw_args)
+
+
+    threaded = True
+
+    def get_paths(self, path):
+        return [path, path.parent / (path.name + ".wal")]
+
+
+    def _open(self, path, *, read_only=False):
         import duckdb
 
-        with contextlib.closing(duckdb.connect(str(path), read_only=True)) as con:
+        con = duckdb.connect(str(path), read_only=read_only)
+        if self.threads is not None:
+            con.execute(f"SET threads = {int(self.threads)}")
+        return con
+
+
+    def _connect(self, path, *, read_only=False):
+        return contextlib.closing(self._open(path, read_only=read_only))
+
+
+    def write(self, df, path):
+        clean_up(path)
+        with self._connect(path) as con:
+            con.register("df_view", df)
+            con.execute("CREATE TABLE df_table AS SELECT * FROM df_view")
+            con.unregister("df_view")
+
+
+    def read(self, path):
+        with self._connect(path, read_only=True) as con:
             con.execute("SELECT * FROM df_table")
             return con.fetchdf()
 
 
+    native_columns = True
+
+    def read_columns(self, path, columns):
+        cols = ", ".join( _quote(c) for c in columns )
+        with self._connect(path, read_only=True) as con:
+            con.execute(f"SELECT {cols} FROM df_table")
+            return con.fetchdf()
+
+
+    native_filter = True
+
+    def read_filtered(self, path, filters):
+        where, params = dfio.query.to_sql(filters, _quote)
+        with self._connect(path, read_only=True) as con:
+            con.execute(f"SELECT * FROM df_table WHERE {where}", params)
+            return con.fetchdf()
+
+
+    def serialize(self, df):
+        # DuckDB can't export an in-memory database as bytes, so return the
+        # connection.
+        con = self._open(":memory:")
+        con.register("df_view", df)
+        con.execute("CREATE TABLE df_table AS SELECT * FROM df_view")
+        con.unregister("df_view")
+        return con
+
+
+    def deserialize(self, con):
+        con.execute("SELECT * FROM df_table")
+        return con.fetchdf()
+
+
+    def write_chunks(self, chunks, path):
+        clean_up(path)
+        with self._connect(path) as con:
+            for i, chunk in enumerate(chunks):
+                con.register("df_view", chunk)
+                con.execute(
+                    "INSERT INTO df_table SELECT * FROM df_view" if i > 0
+                    else "CREATE TABLE df_table AS SELECT * FROM df_view"
+                )
+                con.unregister("df_view")
+
+
+    def read_chunks(self, path, chunk_size):
+        # DuckDB fetches in vectors of 2048 rows.
+        num_vectors = max(1, chunk_size // 2048)
+        with self._connect(path, read_only=True) as con:
+            con.execute("SELECT * FROM df_table")
+            while True:
+                chunk = con.fetch_df_chunk(num_vectors)
+                if len(chunk) == 0:
+                    break
+                yield chunk
+
+
+    def append(self, df, path):
+        exists = path.exists()
+        with self._connect(path) as con:
+            con.register("df_view", df)
+            con.execute(
+                "INSERT INTO df_table SELECT * FROM df_view" if exists
+                else "CREATE TABLE df_table AS SELECT * FROM df_view"
+            )
+            con.unregister("df_view")
+
+
+    native_index = True
+
+    def build_index(self, path, column):
+        name = _quote(f"df_table_{column}")
+        with self._connect(path) as con:
+            con.execute(f"CREATE INDEX {name} ON df_table ({_quote(column)})")
+
+
+    native_range = True
+
+    def read_range(self, path, start, stop):
+        # Rows are inserted in order, with rowids from 0.
+        with self._connect(path, read_only=True) as con:
+            con.execute(
+                "SELECT * FROM df_table WHERE rowid >= ? AND rowid < ?",
+                [start, stop])
+            return con.fetchdf()
+
+
 
-#-------------------------------------------------------------------------------
 
 ALL_METHODS.append(DuckDB())
 
+#-------------------------------------------------------------------------------
+
+def _get_buckets(values, buckets):
+    """
+    Assigns values to `buckets` buckets: integers by remainder, and other
+    values by hash.
+    """
+    # Bucket by value, not by dtype, so that filter values, and categorical
+    # or Arrow columns, land in the same buckets as plain columns.
+    values = pd.Series(np.asarray(values))
+    if values.dtype.kind in "iu":
+        result = values.to_numpy() % buckets
+    else:
+        hashes = pd.util.hash_pandas_object(values, index=False).to_numpy()
+        result = hashes % buckets
+    return result.astype(np.int32)
+
+
+def _quote_str(text):
+    """
+    Quotes an SQL string literal.
+    """
+    return "'" + str(text).replace("'", "''") + "'"
+
+
+class Partitioned(_Method):
+    """
+    Hive-partitioned dataset directory.
+
+    Rows are assigned to buckets by the value of one column, and each bucket
+    is written to its own `KEY=BUCKET` subdirectory, where the key is the
+    column name with `_bucket` appended.  Equality filters on the column are
+    extended with the matching buckets, so that reads skip other partitions.
+    """
+
+    FORMATS = ("parquet", "ipc")
+    ENGINES = ("pyarrow", "duckdb")
+
+    def __init__(
+            self, format="parquet", *, engine="pyarrow", column="instr",
+            buckets=16, comp=None, threads=None):
+        """
+        :param format:
+          File format of partitions, one of `FORMATS`.
+        :param engine:
+          Library that writes and reads partitions.  DuckDB writes only
+          Parquet, with `COPY ... PARTITION_BY`.
+        :param column:
+          Column whose values determine the partition of each row.
+        :param buckets:
+          Number of buckets into which to partition the column's values.
+        """
+        if format not in self.FORMATS:
+            raise ValueError(f"unknown format: {format}")
+        if engine not in self.ENGINES:
+            raise ValueError(f"unknown engine: {engine}")
+        if engine == "duckdb" and format != "parquet":
+            raise ValueError("duckdb writes only parquet partitions")
+        self.format = format
+        self.engine = engine
+        self.column = column
+        self.buckets = buckets
+        self.comp = comp
+        self.threads = threads
+
+
+    def __repr__(self):
+        kw_args = {}
+        if self.engine != "pyarrow":
+            kw_args["engine"] = self.engine
+        if self.column != "instr":
+            kw_args["column"] = self.column
+        kw_args["buckets"] = self.buckets
+        if self.comp is not None:
+            kw_args["comp"] = self.comp
+        if self.threads is not None:
+            kw_args["threads"] = self.threads
+        return format_ctor(self, self.format, **kw_args)
+
+
+    threaded = True
+
+    def to_jso(self):
+        return {
+            **super().to_jso(),
+            "format"    : self.format,
+            "engine"    : self.engine,
+            "column"    : self.column,
+            "buckets"   : self.buckets,
+            "comp"      : self.comp,
+        }
+
+
+    @property
+    def key(self):
+        """
+        Name of the partition key.
+        """
+        return f"{self.column}_bucket"
+
+
+    def _assign(self, df):
+        """
+        Returns `df` with a partition key column.
+        """
+        if self.column not in df.columns:
+            raise NotImplementedError(f"no partition column {self.column}")
+        return df.assign(
+            **{self.key: _get_buckets(df[self.column], self.buckets)})
+
+
+    def get_partition_filters(self, filters):
+        terms = []
+        for col, op, value in filters:
+            if col == self.column and op in ("==", "in"):
+                values = list(value) if op == "in" else [value]
+                if len(values) > 0:
+                    buckets = _get_buckets(values, self.buckets)
+                    terms.append(
+                        (self.key, "in", tuple(sorted(set(buckets.tolist())))))
+        return terms
+
+
+    def _get_partitioning(self):
+        import pyarrow as pa
+        import pyarrow.dataset
+
+        return pyarrow.dataset.partitioning(
+            pa.schema([(self.key, pa.int32())]), flavor="hive")
+
+
+    def _write_dataset(self, df, path, basename_template=None):
+        import pyarrow as pa
+        import pyarrow.dataset
+
+        if self.format == "parquet":
+            file_format = pyarrow.dataset.ParquetFileFormat()
+            file_options = file_format.make_write_options(
+                compression="none" if self.comp is None else self.comp)
+        else:
+            file_format = pyarrow.dataset.IpcFileFormat()
+            file_options = file_format.make_write_options(
+                compression=self.comp)
+
+        with _arrow_threads(self.threads):
+            table = pa.Table.from_pandas(self._assign(df), preserve_index=False)
+            pyarrow.dataset.write_dataset(
+                table, str(path),
+                format=file_format,
+                file_options=file_options,
+                partitioning=self._get_partitioning(),
+                basename_template=basename_template,
+                existing_data_behavior="overwrite_or_ignore",
+                max_partitions=max(1024, self.buckets),
+            )
+
+
+    def _read_dataset(self, path, *, columns=None, filters=None):
+        import pyarrow.dataset
+        import pyarrow.parquet
+
+        with _arrow_threads(self.threads):
+            dataset = pyarrow.dataset.dataset(
+                str(path), format=self.format,
+                partitioning=self._get_partitioning())
+            if columns is None:
+                columns = [ n for n in dataset.schema.names if n != self.key ]
+            expr = (
+                None if filters is None
+                else pyarrow.parquet.filters_to_expression(
+                    dfio.query.to_arrow(filters))
+            )
+            return dataset.to_table(columns=columns, filter=expr).to_pandas()
+
+
+    def _connect(self):
+        import duckdb
+
+        con = duckdb.connect()
+        if self.threads is not None:
+            con.execute(f"SET threads = {int(self.threads)}")
+        return contextlib.closing(con)
+
+
+    def _copy(self, df, path, options=""):
+        comp = "uncompressed" if self.comp is None else self.comp
+        with self._connect() as con:
+            con.register("df_view", self._assign(df))
+            con.execute(
+                f"COPY (SELECT * FROM df_view) TO {_quote_str(path)} "
+                f"(FORMAT PARQUET, COMPRESSION {_quote_str(comp)}, "
+                f"PARTITION_BY ({_quote(self.key)}){options})"
+            )
+            con.unregister("df_view")
+
+
+    def _select(self, path, *, columns=None, filters=None):
+        cols = (
+            f"* EXCLUDE ({_quote(self.key)})" if columns is None
+            else ", ".join( _quote(c) for c in columns )
+        )
+        source = (
+            f"read_parquet({_quote_str(path / '**' / '*.parquet')}, "
+            "hive_partitioning = true)"
+        )
+        where, params = (
+            ("TRUE", []) if filters is None
+            else dfio.query.to_sql(filters, _quote)
+        )
+        with self._connect() as con:
+            con.execute(f"SELECT {cols} FROM {source} WHERE {where}", params)
+            return con.fetchdf()
+
+
+    def write(self, df, path):
+        self.clean_up(path)
+        if self.engine == "pyarrow":
+            self._write_dataset(df, path)
+        else:
+            self._copy(df, path)
+
+
+    def read(self, path):
+        if self.engine == "pyarrow":
+            return self._read_dataset(path)
+        else:
+            return self._select(path)
+
+
+    native_columns = True
+
+    def read_columns(self, path, columns):
+        if self.engine == "pyarrow":
+            return self._read_dataset(path, columns=columns)
+        else:
+            return self._select(path, columns=columns)
+
+
+    native_filter = True
+
+    def read_filtered(self, path, filters):
+        filters = list(filters) + self.get_partition_filters(filters)
+        if self.engine == "pyarrow":
+            return self._read_dataset(path, filters=filters)
+        else:
+            return self._select(path, filters=filters)
+
+
+    def read_range(self, path, start, stop):
+        # Rows are stored in partition order, so positions in the original
+        # data aren't preserved.
+        raise NotImplementedError("partitions don't preserve row order")
+
+
+    def append(self, df, path):
+        # Each append writes new files into the partitions it touches.
+        name = f"part-{uuid.uuid4().hex}"
+        if self.engine == "pyarrow":
+            suffix = ".parquet" if self.format == "parquet" else ".arrow"
+            self._write_dataset(
+                df, path, basename_template=f"{name}-{{i}}{suffix}")
+        else:
+            self._copy(
+                df, path,
+                f", OVERWRITE_OR_IGNORE, FILENAME_PATTERN {_quote_str(name)}")
+
+
+
+
+ALL_METHODS.extend(
+    Partitioned(f, buckets=b)
+    for f in Partitioned.FORMATS
+    for b in (16, 256)
+)
+ALL_METHODS.append(Partitioned(engine="duckdb"))
+
+GRIDS["partitioned"] = [
+    Partitioned(f, engine=e, buckets=b)
+    for f, e in (
+        ("parquet", "pyarrow"),
+        ("ipc", "pyarrow"),
+        ("parquet", "duckdb"),
+    )
+    for b in (1, 4, 16, 64, 256, 1024)
+]
+
@@ -0,0 +1,147 @@
+"""
+Row filters.
+
+A filter is a list of `(column, op, value)` terms, all of which must hold, in
+the same form as pyarrow's filters.  For `in` and `not in`, the value is a
+tuple of values.
+"""
+
+import ast
+import operator
+import re
+
+#-------------------------------------------------------------------------------
+
+OPS = {
+    "=="        : operator.eq,
+    "!="        : operator.ne,
+    "<"         : operator.lt,
+    "<="        : operator.le,
+    ">"         : operator.gt,
+    ">="        : operator.ge,
+    "in"        : None,
+    "not in"    : None,
+}
+
+_TERM_REGEX = re.compile(
+    r"\s*(\w+)\s*(==|!=|<=|>=|<|>|not\s+in\b|in\b)\s*(.+?)\s*$")
+
+def parse(text):
+    """
+    Parses a filter expression.
+
+    The expression is one or more terms separated by `and`.  Each term is
+    `COLUMN OP VALUE`, where VALUE is a Python literal; for `in` and `not in`,
+    a set, list, or tuple literal.
+
+      >>> parse("volume > 50000 and instr in {3, 1}")
+      [('volume', '>', 50000), ('instr', 'in', (1, 3))]
+
+    """
+    filters = []
+    for term in re.split(r"\s+and\s+", text.strip()):
+        match = _TERM_REGEX.match(term)
+        if match is None:
+            raise ValueError(f"invalid filter term: {term}")
+        col, op, value = match.groups()
+        op = " ".join(op.split())
+        try:
+            value = ast.literal_eval(value)
+        except (SyntaxError, ValueError):
+            raise ValueError(f"invalid value in filter term: {term}") from None
+        if op in ("in", "not in"):
+            if not isinstance(value, (set, frozenset, list, tuple)):
+                raise ValueError(f"{op} requires a set of values: {term}")
+            if len({ type(v) for v in value }) > 1:
+                raise ValueError(f"{op} requires values of one type: {term}")
+            value = tuple(sorted(value))
+        filters.append((col, op, value))
+    return filters
+
+
+def unparse(filters):
+    """
+    Formats filters as an expression that `parse` accepts.
+    """
+    return " and ".join( f"{c} {o} {v!r}" for c, o, v in filters )
+
+
+def get_columns(filters):
+    """
+    Returns the names of columns used in `filters`.
+    """
+    return { c for c, _, _ in filters }
+
+
+#-------------------------------------------------------------------------------
+
+def mask(df, filters):
+    """
+    Returns a boolean series selecting rows of `df` that match `filters`.
+    """
+    result = None
+    for col, op, value in filters:
+        if op == "in":
+            m = df[col].isin(value)
+        elif op == "not in":
+            m = ~df[col].isin(value)
+        else:
+            m = OPS[op](df[col], value)
+        result = m if result is None else result & m
+    return result
+
+
+def apply(df, filters):
+    """
+    Returns the rows of `df` that match `filters`.
+    """
+    return df if len(filters) == 0 else df[mask(df, filters)]
+
+
+def to_sql(filters, quote):
+    """
+    Converts filters to an SQL `WHERE` clause with `?` parameters.
+
+    :param quote:
+      Function to quote a column name.
+    :return:
+      The clause and a list of parameters.
+    """
+    terms = []
+    params = []
+    for col, op, value in filters:
+        if op in ("in", "not in"):
+            marks = ", ".join("?" * len(value))
+            terms.append(f"{quote(col)} {op.upper()} ({marks})")
+            params.extend(value)
+        else:
+            terms.append(f"{quote(col)} {op} ?")
+            params.append(value)
+    return " AND ".join(terms), params
+
+
+def to_hdf(filters):
+    """
+    Converts filters to a PyTables `where` expression, as used by pandas.
+    """
+    def term(col, op, value):
+        if op == "in":
+            return f"{col} == {list(value)!r}"
+        elif op == "not in":
+            return f"{col} != {list(value)!r}"
+        else:
+            return f"{col} {op} {value!r}"
+
+    return " & ".join( f"({term(*f)})" for f in filters )
+
+
+def to_arrow(filters):
+    """
+    Converts filters to pyarrow's filter format.
+    """
+    return [
+        (c, o, list(v) if o in ("in", "not in") else v)
+        for c, o, v in filters
+    ]
+
+
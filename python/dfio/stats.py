@@ -0,0 +1,51 @@
+"""
+Statistics for comparing benchmark samples.
+"""
+
+import numpy as np
+
+#-------------------------------------------------------------------------------
+
+def bootstrap(samples, stat=np.median, *, num=2000, rng=None):
+    """
+    Returns `num` bootstrap replicates of `stat` over `samples`.
+    """
+    rng = np.random.default_rng(rng)
+    samples = np.asarray(samples, dtype=float)
+    idx = rng.integers(0, len(samples), (num, len(samples)))
+    return stat(samples[idx], axis=1)
+
+
+def ci(samples, stat=np.median, *, level=0.95, num=2000, rng=None):
+    """
+    Returns a bootstrap confidence interval of `stat` over `samples`.
+
+    :return:
+      The statistic, and lower and upper bounds.
+    """
+    reps = bootstrap(samples, stat, num=num, rng=rng)
+    alpha = (1 - level) / 2
+    lo, hi = np.quantile(reps, [alpha, 1 - alpha])
+    return float(stat(np.asarray(samples, dtype=float))), float(lo), float(hi)
+
+
+def ratio_ci(base, cand, stat=np.median, *, level=0.95, num=2000, rng=None):
+    """
+    Returns a bootstrap confidence interval of the ratio of `stat` over
+    `cand` to `stat` over `base`.
+
+    :return:
+      The ratio, and lower and upper bounds.
+    """
+    rng = np.random.default_rng(rng)
+    base_reps = bootstrap(base, stat, num=num, rng=rng)
+    cand_reps = bootstrap(cand, stat, num=num, rng=rng)
+    alpha = (1 - level) / 2
+    lo, hi = np.quantile(cand_reps / base_reps, [alpha, 1 - alpha])
+    ratio = (
+        stat(np.asarray(cand, dtype=float))
+        / stat(np.asarray(base, dtype=float))
+    )
+    return float(ratio), float(lo), float(hi)
+
+
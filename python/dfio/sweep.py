@@ -0,0 +1,191 @@
+"""
+Data size sweep.
+
+Benchmarks methods over a geometric series of lengths, then fits a cost model
+of fixed overhead plus cost per byte to each method, and reports the sizes at
+which methods cross over.
+"""
+
+import argparse
+import itertools
+import logging
+import numpy as np
+from   pathlib import Path
+import uuid
+
+import dfio.analyze
+import dfio.benchmark
+import dfio.datacache
+import dfio.dataset
+import dfio.db
+import dfio.methods
+
+#-------------------------------------------------------------------------------
+
+def get_lengths(min_length, max_length, steps):
+    """
+    Returns a geometric series of lengths from `min_length` to `max_length`,
+    with `steps` lengths per factor of ten.
+    """
+    num = int(round(np.log10(max_length / min_length) * steps)) + 1
+    lengths = np.geomspace(min_length, max_length, num)
+    return sorted({ int(round(l)) for l in lengths })
+
+
+def iter_data(
+        lengths, *, schema=None, source=None, seed=0, jobs=1,
+        cache_dir=dfio.datacache.DEFAULT_DIR):
+    """
+    Generates benchmark data for each length.
+
+    :param schema:
+      Generate data with this schema, or get it from the dataset cache.
+    :param source:
+      Instead, slice data from the first rows of this dataframe.
+    :return:
+      Iterator of `(length, df)`.
+    """
+    for length in lengths:
+        if source is None:
+            df = dfio.dataset.load(dfio.datacache.get(
+                schema, length, seed, dir=cache_dir, jobs=jobs))
+        elif length > len(source):
+            logging.warning(f"source data has only {len(source)} rows")
+            return
+        else:
+            df = source.iloc[: length]
+        yield length, df
+
+
+def sweep(
+        methods, operations, data, dir, *, meta=None, db_path=None,
+        **options):
+    """
+    Runs benchmarks at each length.
+
+    :param data:
+      Iterator of `(length, df)`, as from `iter_data`.
+    :param meta:
+      Fields added to each record.
+    :param db_path:
+      If not none, append records to this results database.
+    :param options:
+      Options for benchmark functions.
+    :return:
+      List of records.
+    """
+    recs = []
+    for length, df in data:
+        dataset = dfio.dataset.Dataset(df)
+        for method, operation in itertools.product(methods, operations):
+            logging.info(f"{length} {method} {operation}")
+            try:
+                rec = dfio.benchmark._run_job(
+                    method, operation, dataset, dir, **options)
+            except NotImplementedError as exc:
+                logging.info(f"skipped: {operation} {method}: {exc}")
+            except Exception:
+                logging.error(f"failed: {operation} {method}", exc_info=True)
+            else:
+                rec.update(meta or {})
+                if db_path is not None:
+                    dfio.db.append(rec, path=db_path)
+                recs.append(rec)
+    return recs
+
+
+#-------------------------------------------------------------------------------
+
+def main():
+    logging.basicConfig(level=logging.INFO)
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--schema", metavar="SCHEMA", default="bars",
+        help="generate data with SCHEMA [def: bars]")
+    parser.add_argument(
+        "--data", metavar="PATH", type=Path, default=None,
+        help="instead, slice data from pickled dataframe or chunked dataset "
+        "in PATH")
+    parser.add_argument(
+        "--seed", metavar="SEED", type=int, default=0,
+        help="generate from random SEED [def: 0]")
+    parser.add_argument(
+        "--min-length", metavar="LEN", type=float, default=1e3,
+        help="sweep lengths from LEN [def: 1e3]")
+    parser.add_argument(
+        "--max-length", metavar="LEN", type=float, default=1e8,
+        help="sweep lengths up to LEN [def: 1e8]")
+    parser.add_argument(
+        "--steps", metavar="NUM", type=int, default=2,
+        help="sweep NUM lengths per factor of ten [def: 2]")
+    parser.add_argument(
+        "-m", "--method", metavar="CLASS", dest="method_class", default=None,
+        help="select method CLASS [def: all]")
+    parser.add_argument(
+        "-o", "--operation", metavar="OP[,...]", default="write,read",
+        help="select operations OP,... [def: write,read]")
+    parser.add_argument(
+        "--dir", metavar="DIR", type=Path, default=Path("."),
+        help="benchmark reads/writes from DIR [def: .]")
+    parser.add_argument(
+        "--samples", metavar="NUM", type=int, default=3,
+        help="time NUM samples per operation [def: 3]")
+    parser.add_argument(
+        "--memory", action="store_true", default=False,
+        help="also measure memory use")
+    parser.add_argument(
+        "-j", "--jobs", metavar="NUM", type=int, default=1,
+        help="generate columns in NUM processes [def: 1]")
+    parser.add_argument(
+        "--data-cache", metavar="DIR", type=Path,
+        default=dfio.datacache.DEFAULT_DIR,
+        help="cache generated datasets in DIR [def: "
+        f"{dfio.datacache.DEFAULT_DIR}]")
+    parser.add_argument(
+        "--db-path", metavar="DB-PATH", default=dfio.db.DEFAULT_PATH,
+        help=f"benchmark results output path [def: {dfio.db.DEFAULT_PATH}]")
+    args = parser.parse_args()
+
+    methods = dfio.methods.ALL_METHODS
+    if args.method_class is not None:
+        methods = [
+            m for m in methods
+            if m.__class__.__name__ in args.method_class
+        ]
+    operations = args.operation.split(",")
+    for operation in operations:
+        if operation not in dfio.benchmark.ALL_OPERATIONS:
+            parser.error(f"unknown operation: {operation}")
+    if not args.dir.is_dir():
+        parser.error(f"not a directory: {args.dir}")
+    if not 0 < args.min_length <= args.max_length:
+        parser.error("invalid length range")
+
+    lengths = get_lengths(args.min_length, args.max_length, args.steps)
+    meta = {
+        "run"       : uuid.uuid4().hex,
+        "versions"  : dfio.benchmark.get_versions(),
+    }
+    if args.data is None:
+        data = iter_data(
+            lengths, schema=args.schema, seed=args.seed, jobs=args.jobs,
+            cache_dir=args.data_cache)
+        meta.update(schema=args.schema, seed=args.seed)
+    else:
+        source = dfio.dataset.load(args.data)
+        data = iter_data(lengths, source=source)
+        meta.update(data=args.data.name)
+
+    recs = sweep(
+        methods, operations, data, args.dir, meta=meta, db_path=args.db_path,
+        samples=args.samples, memory=args.memory)
+
+    print()
+    dfio.analyze.print_costs(recs)
+
+
+if __name__ == "__main__":
+    main()
+
+
@@ -0,0 +1,53 @@
+import pandas as pd
+import pytest
+
+import dfio.compact
+import dfio.instrument
+from   dfio.methods import PandasCSV, Parquet
+
+#-------------------------------------------------------------------------------
+
+def _get_batches():
+    return [
+        pd.DataFrame({"x": range(i, i + 10), "y": [float(i)] * 10})
+        for i in range(0, 30, 10)
+    ]
+
+
+@pytest.mark.parametrize("engine", ["pyarrow", "fastparquet"])
+def test_parquet_read_appended_measured(tmp_path, engine):
+    pytest.importorskip(engine)
+    method = Parquet(engine=engine)
+    path = tmp_path / "data.parquet"
+    batches = _get_batches()
+    for df in batches:
+        method.append(df, path)
+
+    result = {}
+    def read():
+        result["df"] = method.read_appended(path)
+
+    dfio.instrument.measure(read)
+    expected = pd.concat(batches, ignore_index=True)
+    pd.testing.assert_frame_equal(
+        result["df"].reset_index(drop=True), expected)
+
+
+@pytest.mark.parametrize("engine", ["c", "pyarrow"])
+def test_typed_csv_round_trip_compacted(tmp_path, engine):
+    pytest.importorskip("pyarrow")
+    n = 100
+    df = dfio.compact.compact(
+        pd.DataFrame({
+            "sym"   : [f"S{i % 4}" for i in range(n)],
+            "code"  : [i % 3 for i in range(n)],
+            "price" : [i * 0.5 for i in range(n)],
+            "note"  : [f"note {i}" for i in range(n)],
+        }),
+        "all"
+    )
+    method = PandasCSV(engine=engine, typed=True)
+    path = tmp_path / "data.csv"
+    method.write(df, path)
+    pd.testing.assert_frame_equal(method.read(path), df)
+